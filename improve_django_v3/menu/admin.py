@@ -1,6 +1,89 @@
-from django.contrib import admin
-from .models import Menu, Item, Ingredient
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.options import csrf_protect_m
+from django.contrib.admin.utils import model_ngettext, unquote
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404
+from django.template.response import TemplateResponse
 
-admin.site.register(Menu)
-admin.site.register(Item)
-admin.site.register(Ingredient)
+from . import purge
+from .models import Menu, Item, Ingredient, Job
+
+
+def purge_confirmation(modeladmin, request, queryset, objects_name,
+                       **context):
+    '''This asks before purging a queryset and lists how many rows it
+    would delete from each table.'''
+    context.update(modeladmin.admin_site.each_context(request))
+    context.update(
+        title='Are you sure?',
+        objects_name=objects_name,
+        counts=sorted(purge.count_rows(queryset).items()),
+        opts=modeladmin.model._meta,
+    )
+    request.current_app = modeladmin.admin_site.name
+    return TemplateResponse(
+        request, 'admin/menu/purge_confirmation.html', context)
+
+
+def purge_selected(modeladmin, request, queryset):
+    '''This deletes the selected rows in batches without loading their
+    through-table rows, once the user has confirmed it.'''
+    if not modeladmin.has_delete_permission(request):
+        raise PermissionDenied
+    if not request.POST.get('post'):
+        objects_name = model_ngettext(modeladmin.opts, queryset.count())
+        return purge_confirmation(
+            modeladmin, request, queryset, 'the selected ' + objects_name,
+            selected=queryset,
+            action_checkbox_name=helpers.ACTION_CHECKBOX_NAME)
+    removed = purge.purge(queryset)
+    modeladmin.message_user(
+        request, 'Deleted ' + ', '.join(
+            '{} from {}'.format(count, table)
+            for table, count in sorted(removed.items())),
+        messages.SUCCESS)
+purge_selected.short_description = (
+    'Delete selected %(verbose_name_plural)s in bulk')
+
+
+class PurgeAdmin(admin.ModelAdmin):
+    '''This deletes through menu.purge instead of Django's collector,
+    which would load every related row to list it.'''
+    actions = [purge_selected]
+
+    def get_actions(self, request):
+        actions = super(PurgeAdmin, self).get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    # Like Django's own, so the log entry rolls back if the purge fails.
+    @csrf_protect_m
+    @transaction.atomic
+    def delete_view(self, request, object_id, extra_context=None):
+        obj = self.get_object(request, unquote(object_id))
+        if not self.has_delete_permission(request, obj):
+            raise PermissionDenied
+        if obj is None:
+            raise Http404('{} with pk {!r} does not exist.'.format(
+                self.opts.verbose_name, object_id))
+
+        if request.POST:
+            obj_display = str(obj)
+            self.log_deletion(request, obj, obj_display)
+            self.delete_model(request, obj)
+            return self.response_delete(request, obj_display, obj.pk)
+        return purge_confirmation(
+            self, request, self.model.objects.filter(pk=obj.pk),
+            'the {} "{}"'.format(self.opts.verbose_name, obj),
+            object=obj, **(extra_context or {}))
+
+    def delete_model(self, request, obj):
+        purge.purge(type(obj).objects.filter(pk=obj.pk))
+
+
+admin.site.register(Menu, PurgeAdmin)
+admin.site.register(Item, PurgeAdmin)
+admin.site.register(Ingredient, PurgeAdmin)
+admin.site.register(Job)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MenuConfig(AppConfig):
+    name = 'menu'
+
+    def ready(self):
+        '''This connects the signal handlers for the menu models.'''
+        from . import signals  # noqa: F401
@@ -0,0 +1,139 @@
+'''This builds and serves the site's single CSS bundle.
+
+The vendored Bootstrap files and menu/css/global.css are concatenated and
+minified into settings.MENU_CSS_BUNDLE_NAME by `manage.py build_assets`,
+which has to be run again, and the result committed, after any of them
+changes.
+`collectstatic` then fingerprints it and writes a .gz sibling, and the
+serve view hands fingerprinted files out with a far-future Cache-Control.
+'''
+import gzip
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views import static
+
+# This matches the hash ManifestStaticFilesStorage puts in a file name.
+FINGERPRINT = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt', '.eot', '.ttf')
+
+# This keeps /*! ... */ comments, which hold licence notices.
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(css):
+    '''This strips comments and any whitespace CSS does not need.'''
+    css = CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+def rebase_urls(css, source, bundle):
+    '''This rewrites relative url()s in source so they still point at the
+    same files once the CSS lives at bundle.'''
+    source_dir = posixpath.dirname(source)
+    bundle_dir = posixpath.dirname(bundle)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        path, _, suffix = url.partition('?')
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        url = posixpath.relpath(target, bundle_dir)
+        if suffix:
+            url += '?' + suffix
+        return 'url({0}{1}{0})'.format(quote, url)
+
+    return CSS_URL.sub(rebase, css)
+
+
+def build_bundle(output_dir):
+    '''This writes the minified bundle under output_dir and returns its
+    path. Every source has to be found by the staticfiles finders.'''
+    bundle = settings.MENU_CSS_BUNDLE_NAME
+    parts = []
+    for source in settings.MENU_CSS_BUNDLE:
+        path = finders.find(source)
+        if path is None:
+            raise FileNotFoundError(
+                '{} is missing, run `manage.py vendor_assets`.'.format(source))
+        with open(path, encoding='utf-8') as source_file:
+            parts.append(rebase_urls(source_file.read(), source, bundle))
+
+    path = os.path.join(output_dir, *bundle.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as bundle_file:
+        bundle_file.write(minify_css('\n'.join(parts)))
+    return path
+
+
+_built_bundles = set()
+
+
+def bundle_available():
+    '''This checks whether the bundle has been built. Only a bundle that
+    was found is remembered, so one built later is still picked up.'''
+    bundle = settings.MENU_CSS_BUNDLE_NAME
+    if bundle in _built_bundles:
+        return True
+    if finders.find(bundle) or (
+            settings.STATIC_ROOT and staticfiles_storage.exists(bundle)):
+        _built_bundles.add(bundle)
+        return True
+    return False
+
+
+class GzipManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''This fingerprints static files and writes a .gz next to every text
+    file that gets smaller when compressed.'''
+
+    def post_process(self, *args, **kwargs):
+        for name, hashed_name, processed in super().post_process(
+                *args, **kwargs):
+            if hashed_name and hashed_name.endswith(COMPRESSIBLE):
+                self.write_gzip(hashed_name)
+            yield name, hashed_name, processed
+
+    def write_gzip(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as original:
+            content = original.read()
+        compressed = gzip.compress(content, 9)
+        if len(compressed) < len(content):
+            with open(path + '.gz', 'wb') as gzip_file:
+                gzip_file.write(compressed)
+
+
+def serve(request, path):
+    '''This serves a file from STATIC_ROOT, preferring its .gz sibling,
+    and lets browsers keep fingerprinted files for a year.'''
+    document_root = settings.STATIC_ROOT
+    path = posixpath.normpath(path).lstrip('/')
+    gzip_path = os.path.join(document_root, path + '.gz')
+    if ('gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '') and
+            os.path.exists(gzip_path)):
+        response = static.serve(request, path + '.gz', document_root)
+        response['Content-Encoding'] = 'gzip'
+        content_type = static.mimetypes.guess_type(path)[0]
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    else:
+        response = static.serve(request, path, document_root)
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if FINGERPRINT.search(path):
+        patch_cache_control(response, public=True, max_age=31536000,
+                            immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=300)
+    return response
@@ -1,10 +1,20 @@
 import datetime
+import re
 import string
 
 from django import forms
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from django.forms.extras.widgets import SelectDateWidget
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .models import Menu
+from . import signals
+from .models import Item, Menu
+
+# This matches any punctuation except for apostrophes.
+SEASON_PUNCTUATION = re.compile(
+    '[{}]'.format(re.escape(string.punctuation.replace("'", ''))))
 
 
 def two_years_from_now():
@@ -43,12 +53,114 @@ class MenuForm(forms.ModelForm):
         '''This makes sure that season does not contain punctuation
         except for apostrophe.'''
         season = self.cleaned_data['season']
-        punctuation_less_apostrophe = [letter for letter in string.punctuation]
-        punctuation_less_apostrophe.remove("'")
-        ''.join(punctuation_less_apostrophe)
-        for character in season:
-            if character in punctuation_less_apostrophe:
-                raise forms.ValidationError(
-                    "You can not have any punctuation except for" +
-                    " apostrophes.")
+        if SEASON_PUNCTUATION.search(season):
+            raise forms.ValidationError(
+                "You can not have any punctuation except for" +
+                " apostrophes.")
         return season
+
+
+class SharedItemsField(forms.ModelMultipleChoiceField):
+    '''This checks the chosen Item pks against the Items its formset
+    loaded for every row at once instead of querying for each form.'''
+    formset = None
+
+    def _check_values(self, value):
+        items = self.formset.posted_items
+        chosen = []
+        for pk in set(value):
+            try:
+                pk = int(pk)
+            except (TypeError, ValueError):
+                raise forms.ValidationError(
+                    self.error_messages['invalid_pk_value'],
+                    code='invalid_pk_value',
+                    params={'pk': pk},
+                )
+            if pk not in items:
+                raise forms.ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': pk},
+                )
+            chosen.append(items[pk])
+        return sorted(chosen, key=lambda item: item.pk)
+
+
+class BulkMenuForm(MenuForm):
+    '''This is a MenuForm for one row of BaseMenuFormSet.'''
+    items = SharedItemsField(queryset=Item.objects.all())
+
+
+class BaseMenuFormSet(forms.BaseFormSet):
+    '''This validates many new Menus together and saves them with a few
+    bulk queries.'''
+
+    def _construct_form(self, i, **kwargs):
+        form = super(BaseMenuFormSet, self)._construct_form(i, **kwargs)
+        form.fields['items'].formset = self
+        # Every row lists the same Items, so they are read once.
+        form.fields['items'].choices = lambda: self.item_choices
+        return form
+
+    @cached_property
+    def posted_items(self):
+        '''This loads the Items chosen in any row with one query.'''
+        pks = set()
+        for i in range(self.total_form_count()):
+            for pk in self.data.getlist('{}-items'.format(self.add_prefix(i))):
+                if pk.isdigit():
+                    pks.add(int(pk))
+        return Item.objects.in_bulk(pks)
+
+    @cached_property
+    def item_choices(self):
+        '''This reads the Items every row can choose from once.'''
+        return [(item.pk, str(item)) for item in Item.objects.all()]
+
+    @transaction.atomic
+    def save(self):
+        '''This creates a Menu for every filled in row and returns them.'''
+        rows = [form.cleaned_data for form in self.forms
+                if form.cleaned_data]
+        if not rows:
+            return []
+
+        # bulk_create does not set pks on every database, so the new
+        # rows are read back by their shared created_date past the last
+        # existing pk. Matching them to rows by position assumes the
+        # database hands out increasing pks in insert order, as SQLite,
+        # PostgreSQL and MySQL do for a single INSERT, and that no other
+        # writer commits a Menu with the same created_date meanwhile. A
+        # count that does not match rolls everything back.
+        last_pk = Menu.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        stamp = timezone.now()
+        Menu.objects.bulk_create([
+            Menu(season=row['season'],
+                 expiration_date=row['expiration_date'],
+                 created_date=stamp)
+            for row in rows
+        ])
+        menus = list(Menu.objects.filter(
+            pk__gt=last_pk, created_date=stamp).order_by('pk'))
+        if len(menus) != len(rows):
+            raise IntegrityError(
+                'Read back {} new menus for {} rows.'.format(
+                    len(menus), len(rows)))
+
+        Menu.items.through.objects.bulk_create([
+            Menu.items.through(menu_id=menu.pk, item_id=item.pk)
+            for menu, row in zip(menus, rows)
+            for item in row['items']
+        ])
+
+        # bulk_create sends no model signals.
+        signals.menus_changed(
+            [menu.pk for menu in menus],
+            [item.pk for row in rows for item in row['items']])
+        return menus
+
+
+MenuFormSet = forms.formset_factory(
+    BulkMenuForm, formset=BaseMenuFormSet, extra=10, max_num=100,
+    validate_max=True)
@@ -0,0 +1,132 @@
+'''This runs slow work outside of the request that asks for it.
+
+A job is the dotted path of a function plus JSON arguments, stored in
+the Job table by enqueue() and run by `manage.py run_worker`. An identical
+job that is still pending is not queued twice. Failed jobs are retried
+with exponential backoff until they run out of attempts, and so are jobs
+whose worker died: a claim only lasts JOB_TIMEOUT seconds.
+'''
+import hashlib
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Avg, Count, F, Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args, **kwargs):
+    '''This queues task(*args, **kwargs), where task is the dotted path of
+    a function and the arguments can be turned into JSON. It returns the
+    pending Job, which may be one that was already queued.
+
+    Looking for a pending copy and creating the job are two queries, so
+    two processes queueing the same job at the same moment can both
+    create it. Tasks must be safe to run twice.'''
+    arguments = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True)
+    dedup_key = hashlib.sha256(
+        '{}:{}'.format(task, arguments).encode('utf-8')).hexdigest()
+
+    job = Job.objects.filter(dedup_key=dedup_key, status=Job.PENDING).first()
+    if job is None:
+        job = Job.objects.create(
+            task=task, arguments=arguments, dedup_key=dedup_key,
+            max_attempts=settings.JOB_MAX_ATTEMPTS)
+    return job
+
+
+def backoff(attempts):
+    '''This returns how long to wait before another try.'''
+    return timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def reclaim_expired():
+    '''This counts a job that has been running for longer than
+    JOB_TIMEOUT as a failed attempt, since its worker was most likely
+    killed, and queues it again or marks it failed.'''
+    now = timezone.now()
+    expired = Job.objects.filter(
+        status=Job.RUNNING,
+        started_date__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+    for job in expired:
+        if job.attempts < job.max_attempts:
+            changes = {'status': Job.PENDING,
+                       'run_after': now + backoff(job.attempts)}
+        else:
+            changes = {'status': Job.FAILED, 'finished_date': now}
+        updated = Job.objects.filter(
+            pk=job.pk, status=Job.RUNNING, started_date=job.started_date
+        ).update(last_error='Timed out after {} seconds.'.format(
+            settings.JOB_TIMEOUT), **changes)
+        if updated:
+            logger.warning('Job %s (%s) timed out on attempt %s',
+                           job.pk, job.task, job.attempts)
+
+
+def claim(limit):
+    '''This marks up to limit due jobs as running and returns their pks.
+    A job another worker claimed first is skipped.'''
+    reclaim_expired()
+    due = Job.objects.filter(
+        status=Job.PENDING, run_after__lte=timezone.now()
+    ).order_by('run_after').values_list('pk', flat=True)[:limit]
+
+    claimed = []
+    for pk in list(due):
+        updated = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING, started_date=timezone.now(),
+            attempts=F('attempts') + 1)
+        if updated:
+            claimed.append(pk)
+    return claimed
+
+
+def run_job(pk):
+    '''This runs a claimed job and records how it went and how long it
+    took.'''
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=pk)
+        start = time.perf_counter()
+        try:
+            arguments = json.loads(job.arguments)
+            import_string(job.task)(*arguments['args'], **arguments['kwargs'])
+        except Exception:
+            job.duration = time.perf_counter() - start
+            job.last_error = traceback.format_exc()
+            if job.attempts < job.max_attempts:
+                job.status = Job.PENDING
+                job.run_after = timezone.now() + backoff(job.attempts)
+            else:
+                job.status = Job.FAILED
+                job.finished_date = timezone.now()
+            logger.exception('Job %s (%s) failed on attempt %s',
+                             job.pk, job.task, job.attempts)
+        else:
+            job.duration = time.perf_counter() - start
+            job.status = Job.DONE
+            job.finished_date = timezone.now()
+            logger.info('Job %s (%s) took %.3fs', job.pk, job.task,
+                        job.duration)
+        job.save()
+        return job.status
+    finally:
+        close_old_connections()
+
+
+def stats():
+    '''This returns, per task, how many jobs are in each status and the
+    average and longest run time of the finished ones.'''
+    rows = Job.objects.values('task', 'status').annotate(
+        count=Count('pk'), average=Avg('duration'), longest=Max('duration')
+    ).order_by('task', 'status')
+    return list(rows)
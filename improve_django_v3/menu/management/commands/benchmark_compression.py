@@ -0,0 +1,51 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+
+from menu import publish, views
+from menu.middleware import minify_html
+
+
+def timed(function, repeat):
+    '''This returns the result of function and its mean time in ms.'''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+class Command(BaseCommand):
+    help = ('Reports the bytes saved by HTML minification and gzip on the '
+            'item and menu lists, and the CPU time each one costs. Run '
+            '`manage.py seed_catalogue` first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        pages = (
+            ('item_list', views.item_list),
+            ('menu_list', views.menu_list),
+        )
+        self.stdout.write(
+            '{:<10} {:>9} {:>9} {:>9} {:>9} {:>8} {:>8} {:>8}'.format(
+                'page', 'raw', 'minified', 'gzip', 'both',
+                'render', 'minify', 'gzip'))
+        for name, view in pages:
+            url = reverse(name)
+            raw, render_ms = timed(
+                lambda: publish.render_view(view, url), repeat)
+            html = raw.decode('utf-8')
+            minified, minify_ms = timed(
+                lambda: minify_html(html).encode('utf-8'), repeat)
+            compressed, gzip_ms = timed(
+                lambda: gzip.compress(raw, 6), repeat)
+            both = gzip.compress(minified, 6)
+            self.stdout.write(
+                '{:<10} {:>9} {:>9} {:>9} {:>9} {:>6.2f}ms {:>6.2f}ms '
+                '{:>6.2f}ms'.format(
+                    name, len(raw), len(minified), len(compressed),
+                    len(both), render_ms, minify_ms, gzip_ms))
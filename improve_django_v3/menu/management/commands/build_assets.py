@@ -0,0 +1,18 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from menu import assets
+
+
+class Command(BaseCommand):
+    help = ('Concatenates and minifies MENU_CSS_BUNDLE into '
+            'MENU_CSS_BUNDLE_NAME. Run collectstatic afterwards to '
+            'fingerprint and gzip it.')
+
+    def handle(self, *args, **options):
+        path = assets.build_bundle(
+            os.path.join(settings.BASE_DIR, 'menu', 'static'))
+        self.stdout.write('Wrote {} ({} bytes)'.format(
+            path, os.path.getsize(path)))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from menu import publish
+
+
+class Command(BaseCommand):
+    help = ('Pre-renders the current menus, their menu pages and item pages '
+            'to static HTML with .gz siblings in MENU_PUBLISH_ROOT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Keep running and rebuild at every expiration_date '
+                 'rollover.')
+        parser.add_argument(
+            '--idle', type=int, default=3600,
+            help='Most seconds to sleep before looking for an earlier '
+                 'rollover, or before publishing again when no menu is '
+                 'current (with --watch).')
+
+    def handle(self, *args, **options):
+        while True:
+            urls = publish.publish_all()
+            self.stdout.write('Published {} pages to {}'.format(
+                len(urls), publish.publish_root()))
+            if not options['watch']:
+                return
+            self.wait_for_rollover(options['idle'])
+
+    def wait_for_rollover(self, idle):
+        '''This sleeps until the next rollover. A menu saved meanwhile may
+        expire sooner, so it looks again at least every idle seconds.'''
+        announced = None
+        while True:
+            rollover = publish.next_rollover()
+            if rollover is None:
+                time.sleep(idle)
+                return
+            wait = (rollover - timezone.now()).total_seconds()
+            if wait <= 0:
+                return
+            if rollover != announced:
+                self.stdout.write('Next rollover at {}'.format(rollover))
+                announced = rollover
+            time.sleep(min(max(wait, 1), idle))
@@ -0,0 +1,58 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu import purge
+
+
+def date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = ('Deletes old menus and unused items and ingredients in batches '
+            'and reports how many rows left each table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expired-before', type=date, metavar='YYYY-MM-DD',
+            help='Delete the menus that expired before this date.')
+        parser.add_argument(
+            '--season',
+            help='Delete the menus of this season, current ones too unless '
+                 '--expired-before is also given.')
+        parser.add_argument(
+            '--unused-items', action='store_true',
+            help='Delete the items that are not on any menu.')
+        parser.add_argument(
+            '--unused-ingredients', action='store_true',
+            help='Delete the ingredients that no item uses.')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the rows that would be deleted.')
+
+    def handle(self, *args, **options):
+        querysets = []
+        if options['expired_before'] or options['season']:
+            querysets.append(purge.select_menus(
+                before=options['expired_before'], season=options['season']))
+        # Each queryset runs after the ones before it have deleted their
+        # rows, so --unused-items also catches the items only the deleted
+        # menus used. A dry run deletes nothing and does not count those.
+        if options['unused_items']:
+            querysets.append(purge.unused_items())
+        if options['unused_ingredients']:
+            querysets.append(purge.unused_ingredients())
+        if not querysets:
+            raise CommandError(
+                'Give --expired-before, --season, --unused-items or '
+                '--unused-ingredients.')
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for queryset in querysets:
+            removed = purge.purge(queryset, batch_size=options['batch_size'],
+                                  dry_run=options['dry_run'])
+            for table, count in sorted(removed.items()):
+                self.stdout.write('{} {} rows from {}'.format(
+                    verb, count, table))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from menu import readmodel
+
+
+class Command(BaseCommand):
+    help = ('Builds the in-memory snapshot of the current menus and reports '
+            'its size and how long it took.')
+
+    def handle(self, *args, **options):
+        snapshot = readmodel.build()
+        ingredients = set(
+            ingredient.pk for item in snapshot.items_by_pk.values()
+            for ingredient in item.ingredients)
+        self.stdout.write(
+            '{} menus, {} items, {} ingredients'.format(
+                len(snapshot.menus), len(snapshot.items_by_pk),
+                len(ingredients)))
+        self.stdout.write('{:.1f} KiB built in {:.1f}ms'.format(
+            snapshot.size / 1024, snapshot.build_seconds * 1000))
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from menu import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued background jobs on a pool of threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run jobs in worker processes instead of threads.')
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Seconds to wait when no job is due.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Stop as soon as no job is due.')
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Print job counts and timings per task and exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            return self.print_stats()
+
+        if options['processes']:
+            pool = ProcessPoolExecutor(options['workers'])
+        else:
+            pool = ThreadPoolExecutor(options['workers'])
+
+        with pool:
+            while True:
+                claimed = jobs.claim(options['workers'])
+                if not claimed:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+                if options['processes']:
+                    # The pool forks its processes on first use, and they
+                    # must not inherit the connection claim() opened.
+                    connections.close_all()
+                for pk, status in zip(claimed, pool.map(jobs.run_job,
+                                                        claimed)):
+                    self.stdout.write('Job {} {}'.format(pk, status))
+
+    def print_stats(self):
+        self.stdout.write('{:<40} {:<8} {:>6} {:>9} {:>9}'.format(
+            'task', 'status', 'jobs', 'average', 'longest'))
+        for row in jobs.stats():
+            self.stdout.write(
+                '{task:<40} {status:<8} {count:>6} {average:>8.3f}s '
+                '{longest:>8.3f}s'.format(
+                    **dict(row, average=row['average'] or 0,
+                           longest=row['longest'] or 0)))
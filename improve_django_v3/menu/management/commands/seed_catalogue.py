@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from menu.seed import seed_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a made up catalogue for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--menus', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=200)
+        parser.add_argument('--chefs', type=int, default=10)
+        parser.add_argument('--items-per-menu', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        seed_catalogue(
+            items=options['items'], menus=options['menus'],
+            ingredients=options['ingredients'], chefs=options['chefs'],
+            items_per_menu=options['items_per_menu'], seed=options['seed'])
+        self.stdout.write('Seeded {items} items on {menus} menus.'.format(
+            **options))
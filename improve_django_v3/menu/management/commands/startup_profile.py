@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# This runs in a fresh interpreter so nothing has been imported yet.
+PROFILE_SCRIPT = (
+    'import json\n'
+    'from mysite.warmup import profile_startup\n'
+    'print(json.dumps(profile_startup()))\n'
+)
+
+
+class Command(BaseCommand):
+    help = ('Reports how long a fresh worker spends in django.setup(), '
+            'importing each project module and in each warmup step.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'mysite.settings'))
+        output = subprocess.check_output(
+            [sys.executable, '-c', PROFILE_SCRIPT],
+            cwd=settings.BASE_DIR, env=env)
+        timings = json.loads(output.decode('utf-8').splitlines()[-1])
+
+        for name, seconds in timings:
+            self.stdout.write('{:>9.2f}ms  {}'.format(seconds * 1000, name))
+        self.stdout.write('{:>9.2f}ms  total'.format(
+            sum(seconds for _, seconds in timings) * 1000))
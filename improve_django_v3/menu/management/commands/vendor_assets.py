@@ -0,0 +1,22 @@
+import os
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+APP_STATIC = os.path.join(settings.BASE_DIR, 'menu', 'static')
+
+
+class Command(BaseCommand):
+    help = ('Downloads the pinned third party assets in MENU_VENDOR_ASSETS '
+            'into menu/static so nothing is loaded from a CDN.')
+
+    def handle(self, *args, **options):
+        for name, url in sorted(settings.MENU_VENDOR_ASSETS.items()):
+            if url.startswith('//'):
+                url = 'https:' + url
+            path = os.path.join(APP_STATIC, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with urlopen(url) as response, open(path, 'wb') as asset:
+                asset.write(response.read())
+            self.stdout.write('Vendored {}'.format(name))
@@ -0,0 +1,180 @@
+'''Middleware for the menu site: response compression, HTML minification
+and write rate limiting.'''
+import codecs
+import re
+from gzip import GzipFile
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+from django.utils.text import StreamingBuffer
+
+from . import throttle
+
+# Whitespace inside these elements is part of the content.
+PRESERVED = re.compile(
+    r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+PRESERVED_OPEN = re.compile(r'<(pre|textarea|script|style)\b', re.IGNORECASE)
+# A tag with its attributes, which may hold quoted whitespace or '>'.
+TAG = re.compile(r'''<(?:[^>"']|"[^"]*"|'[^']*')*>''')
+WHITESPACE = re.compile(r'\s+')
+
+
+def collapse_whitespace(match):
+    '''This keeps a single newline or space in place of a whitespace run.'''
+    return '\n' if '\n' in match.group(0) else ' '
+
+
+def collapse_text(html):
+    '''This collapses the whitespace between tags, leaving the tags and
+    their attribute values as they are.'''
+    parts = []
+    position = 0
+    for match in TAG.finditer(html):
+        parts.append(WHITESPACE.sub(collapse_whitespace,
+                                    html[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(WHITESPACE.sub(collapse_whitespace, html[position:]))
+    return ''.join(parts)
+
+
+def minify_html(html):
+    '''This collapses runs of whitespace into one character, leaving tags
+    and the content of <pre>, <textarea>, <script> and <style> alone.'''
+    parts = []
+    position = 0
+    for match in PRESERVED.finditer(html):
+        parts.append(collapse_text(html[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(collapse_text(html[position:]))
+    return ''.join(parts)
+
+
+def safe_cut(html):
+    '''This returns how much of html can be minified without splitting a
+    tag or a preserved element that a later chunk finishes.'''
+    cut = 0
+    for match in TAG.finditer(html):
+        cut = match.end()
+    position = 0
+    for match in PRESERVED.finditer(html, 0, cut):
+        position = match.end()
+    unclosed = PRESERVED_OPEN.search(html, position, cut)
+    if unclosed:
+        return unclosed.start()
+    return cut
+
+
+def minify_html_sequence(sequence, charset):
+    '''This minifies streamed HTML a complete run of tags at a time.'''
+    decoder = codecs.getincrementaldecoder(charset)()
+    pending = ''
+    for chunk in sequence:
+        pending += decoder.decode(chunk)
+        cut = safe_cut(pending)
+        if cut:
+            yield minify_html(pending[:cut]).encode(charset)
+            pending = pending[cut:]
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield minify_html(pending).encode(charset)
+
+
+def compress_sequence(sequence):
+    '''This gzips streamed content, flushing after every chunk so the
+    client gets each chunk as soon as the view produces it.'''
+    buf = StreamingBuffer()
+    zfile = GzipFile(mode='wb', compresslevel=6, fileobj=buf)
+    yield buf.read()
+    for item in sequence:
+        zfile.write(item)
+        zfile.flush()
+        data = buf.read()
+        if data:
+            yield data
+    zfile.close()
+    yield buf.read()
+
+
+def content_type(response):
+    '''This returns the media type of a response without its parameters.'''
+    return response.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    '''This gzips responses whose type is in MENU_GZIP_CONTENT_TYPES and that
+    are at least MENU_GZIP_MIN_LENGTH bytes long. Streamed responses are
+    always compressed since their length is not known up front. Pages
+    that rendered a CSRF token are not, since compressing a secret next
+    to text the client controls allows the BREACH attack.'''
+
+    def process_response(self, request, response):
+        if content_type(response) not in settings.MENU_GZIP_CONTENT_TYPES:
+            return response
+        if request.META.get('CSRF_COOKIE_USED'):
+            return response
+        if not response.streaming and \
+                len(response.content) < settings.MENU_GZIP_MIN_LENGTH:
+            return response
+
+        if not response.streaming:
+            return super().process_response(request, response)
+
+        if response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_gzip.search(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        response.streaming_content = compress_sequence(
+            response.streaming_content)
+        del response['Content-Length']
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub('"$', ';gzip"', response['ETag'])
+        response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class HTMLMinifyMiddleware(object):
+    '''This strips indentation out of HTML responses when MENU_MINIFY_HTML
+    is on.'''
+
+    def process_response(self, request, response):
+        if not getattr(settings, 'MENU_MINIFY_HTML', False):
+            return response
+        if content_type(response) != 'text/html' or \
+                response.has_header('Content-Encoding'):
+            return response
+
+        charset = response.charset
+        if response.streaming:
+            response.streaming_content = minify_html_sequence(
+                response.streaming_content, charset)
+        else:
+            response.content = minify_html(
+                response.content.decode(charset)).encode(charset)
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(response.content))
+        return response
+
+
+class RateLimitMiddleware(object):
+    '''This turns away clients that send requests to the views named in
+    MENU_RATE_LIMIT['VIEWS'] faster than the token bucket allows. It runs
+    before the view, so no form is built for a refused request.'''
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = settings.MENU_RATE_LIMIT
+        view_name = request.resolver_match.url_name
+        if request.method not in config['METHODS'] or \
+                view_name not in config['VIEWS']:
+            return None
+
+        wait = throttle.get_bucket().take(throttle.client_keys(request))
+        if wait:
+            throttle.count_shed('rate', view_name)
+            return throttle.too_many_requests(wait)
+        return None
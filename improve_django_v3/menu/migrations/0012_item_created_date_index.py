@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-19 13:28
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0011_remove_menu_expiration_date_temp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='created_date',
+            field=models.DateField(db_index=True, default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-19 13:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='menu',
+            name='expiration_date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
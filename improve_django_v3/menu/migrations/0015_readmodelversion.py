@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-19 13:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    ReadModelVersion = apps.get_model('menu', 'ReadModelVersion')
+    ReadModelVersion.objects.using(schema_editor.connection.alias).create(
+        pk=1, number=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0014_menu_expiration_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadModelVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
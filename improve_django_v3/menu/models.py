@@ -9,7 +9,7 @@ class Menu(models.Model):
     items = models.ManyToManyField('Item', related_name='items')
     created_date = models.DateTimeField(
             default=timezone.now)
-    expiration_date = models.DateField()
+    expiration_date = models.DateField(db_index=True)
 
     def __str__(self):
         return self.season
@@ -19,7 +19,8 @@ class Item(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     chef = models.ForeignKey('auth.User')
-    created_date = models.DateField(default=datetime.date.today)
+    created_date = models.DateField(default=datetime.date.today,
+                                    db_index=True)
     standard = models.BooleanField(default=False)
     ingredients = models.ManyToManyField('Ingredient')
 
@@ -32,3 +33,45 @@ class Ingredient(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    task = models.CharField(max_length=200)
+    arguments = models.TextField(default='{}')
+    dedup_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_date = models.DateTimeField(default=timezone.now)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        index_together = [('status', 'run_after')]
+
+    def __str__(self):
+        return '{} ({})'.format(self.task, self.status)
+
+
+class ReadModelVersion(models.Model):
+    '''This single row counts committed changes to the menus, so every
+    process can tell when its copy in menu.readmodel is out of date.'''
+    number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.number)
@@ -0,0 +1,161 @@
+'''This pre-renders the public menu pages to static HTML files.
+
+The home page, every current menu_detail page and every item_detail page
+for an item on a current menu are written to settings.MENU_PUBLISH_ROOT
+together with a precompressed .gz sibling, so a plain static file server
+can answer those URLs without touching Django.
+'''
+import datetime
+import gzip
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.urlresolvers import reverse
+from django.http import HttpRequest
+from django.utils import timezone
+
+from . import readmodel, views
+from .middleware import minify_html
+from .models import Item, Menu
+
+
+def publish_root():
+    '''This returns the directory the pages are written to.'''
+    return settings.MENU_PUBLISH_ROOT
+
+
+def current_menus():
+    '''This returns the Menus that have not expired yet.'''
+    return Menu.objects.filter(expiration_date__gte=datetime.date.today())
+
+
+def current_item_pks():
+    '''This returns the pks of every Item on a current Menu.'''
+    return set(
+        Item.objects.filter(
+            items__expiration_date__gte=datetime.date.today()
+        ).values_list('pk', flat=True)
+    )
+
+
+def page_path(url):
+    '''This turns a site URL like /menu/1/ into the file that holds it.'''
+    return os.path.join(publish_root(), url.strip('/'), 'index.html')
+
+
+def render_view(view, url, **kwargs):
+    '''This runs a view for an anonymous GET of url and returns the body.
+    The view reads the database itself rather than the read model, which
+    may not have caught up with the change being published.'''
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = url
+    request.META['SERVER_NAME'] = 'localhost'
+    request.META['SERVER_PORT'] = '80'
+    request.user = AnonymousUser()
+    with readmodel.disabled():
+        return view(request, **kwargs).content
+
+
+def render_page(view, url, **kwargs):
+    '''This renders a page the way the HTML middleware would send it.'''
+    content = render_view(view, url, **kwargs)
+    if getattr(settings, 'MENU_MINIFY_HTML', False):
+        content = minify_html(content.decode('utf-8')).encode('utf-8')
+    return content
+
+
+def write_page(url, content):
+    '''This writes a page and its .gz sibling, replacing both atomically.'''
+    path = page_path(url)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    for target, data in ((path, content),
+                         (path + '.gz', gzip.compress(content, 9))):
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, target)
+
+
+def remove_page(url):
+    '''This removes a page that should no longer be served.'''
+    path = page_path(url)
+    for target in (path, path + '.gz'):
+        if os.path.exists(target):
+            os.remove(target)
+
+
+def publish_index():
+    '''This writes the list of current menus.'''
+    url = reverse('menu_list')
+    write_page(url, render_page(views.menu_list, url))
+    return url
+
+
+def publish_menu(pk, current_pks):
+    '''This writes a current Menu page or removes an expired one.'''
+    url = reverse('menu_detail', kwargs={'pk': pk})
+    if pk in current_pks:
+        write_page(url, render_page(views.menu_detail, url, pk=pk))
+    else:
+        remove_page(url)
+    return url
+
+
+def publish_item(pk, current_pks):
+    '''This writes an Item page if the Item is on a current Menu.'''
+    url = reverse('item_detail', kwargs={'pk': pk})
+    if pk in current_pks:
+        write_page(url, render_page(views.item_detail, url, pk=pk))
+    else:
+        remove_page(url)
+    return url
+
+
+def publish_pages(menu_pks=(), item_pks=()):
+    '''This regenerates only the pages affected by a change to the given
+    Menus and Items. The home page is always rewritten because it lists
+    every current menu and its items.'''
+    urls = [publish_index()]
+    current_pks = set(current_menus().values_list('pk', flat=True))
+    for pk in set(menu_pks):
+        urls.append(publish_menu(pk, current_pks))
+
+    current_items = current_item_pks()
+    for pk in set(item_pks):
+        urls.append(publish_item(pk, current_items))
+    return urls
+
+
+def publish_all():
+    '''This rebuilds the whole snapshot and then clears out the pages of
+    menus and items that are no longer current.'''
+    menu_pks = list(current_menus().values_list('pk', flat=True))
+    item_pks = list(current_item_pks())
+    urls = publish_pages(menu_pks=menu_pks, item_pks=item_pks)
+
+    published = set(page_path(url) for url in urls)
+    for directory, _, files in os.walk(publish_root()):
+        if 'index.html' in files:
+            path = os.path.join(directory, 'index.html')
+            if path not in published:
+                remove_page(os.path.relpath(directory, publish_root()))
+    return urls
+
+
+def next_rollover(today=None):
+    '''This returns the aware datetime of the next midnight at which a
+    current Menu expires, or None if no menu is current.'''
+    today = today or datetime.date.today()
+    expiring = Menu.objects.filter(expiration_date__gte=today).order_by(
+        'expiration_date').values_list('expiration_date', flat=True).first()
+    if expiring is None:
+        return None
+    rollover = datetime.datetime.combine(
+        expiring + datetime.timedelta(1), datetime.time.min)
+    return timezone.make_aware(rollover)
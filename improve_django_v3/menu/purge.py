@@ -0,0 +1,112 @@
+'''This deletes Menus, Items and Ingredients in bulk.
+
+QuerySet.delete() loads every row it deletes, and every through-table row
+pointing at them, to send signals and follow cascades. Nothing but the
+through tables points at these models, so purge() deletes a batch of
+through-table rows and then their parents with one DELETE each. Each
+batch is its own transaction and tells menus_changed about the pages it
+touched once. Deleting a User still goes through Django's collector.
+'''
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import signals
+from .models import Ingredient, Item, Menu
+
+MenuItem = Menu.items.through
+ItemIngredient = Item.ingredients.through
+
+# This lists the through-table rows that point at each model.
+THROUGH_COLUMNS = {
+    Menu: ((MenuItem, 'menu_id'),),
+    Item: ((MenuItem, 'item_id'), (ItemIngredient, 'item_id')),
+    Ingredient: ((ItemIngredient, 'ingredient_id'),),
+}
+
+
+def select_menus(before=None, season=None):
+    '''This selects the Menus that expired before a date, of a season, or
+    both. A season alone selects its current Menus too.'''
+    menus = Menu.objects.all()
+    if before is not None:
+        menus = menus.filter(expiration_date__lt=before)
+    if season is not None:
+        menus = menus.filter(season=season)
+    return menus
+
+
+def unused_items():
+    '''This selects the Items that are not on any Menu.'''
+    return Item.objects.filter(items__isnull=True)
+
+
+def unused_ingredients():
+    '''This selects the Ingredients that no Item uses.'''
+    return Ingredient.objects.filter(item__isnull=True)
+
+
+def affected_pages(model, pks):
+    '''This returns the pks of the Menus and Items whose pages show the
+    rows about to be deleted.'''
+    if model is Menu:
+        item_pks = MenuItem.objects.filter(
+            menu_id__in=pks).values_list('item_id', flat=True)
+        return pks, set(item_pks)
+    if model is Item:
+        item_pks = pks
+    else:
+        item_pks = set(ItemIngredient.objects.filter(
+            ingredient_id__in=pks).values_list('item_id', flat=True))
+    menu_pks = MenuItem.objects.filter(
+        item_id__in=item_pks).values_list('menu_id', flat=True)
+    return set(menu_pks), item_pks
+
+
+def delete_rows(model, pks):
+    '''This deletes the rows with the given pks and every through-table row
+    pointing at them, and returns how many rows left each table.'''
+    removed = Counter()
+    for through, column in THROUGH_COLUMNS[model]:
+        # _raw_delete is a single DELETE without signals or collecting.
+        removed[through._meta.db_table] += through.objects.filter(
+            **{column + '__in': pks})._raw_delete(through.objects.db)
+    removed[model._meta.db_table] += model.objects.filter(
+        pk__in=pks)._raw_delete(model.objects.db)
+    return removed
+
+
+def count_rows(queryset):
+    '''This returns how many rows purge(queryset) would delete from each
+    table.'''
+    model = queryset.model
+    pks = queryset.values('pk')
+    counts = Counter({model._meta.db_table: queryset.count()})
+    for through, column in THROUGH_COLUMNS[model]:
+        counts[through._meta.db_table] += through.objects.filter(
+            **{column + '__in': pks}).count()
+    return counts
+
+
+def purge(queryset, batch_size=None, dry_run=False):
+    '''This deletes the rows of a Menu, Item or Ingredient queryset
+    batch_size at a time and returns how many rows left each table. With
+    dry_run it only counts them.'''
+    if dry_run:
+        return count_rows(queryset)
+
+    model = queryset.model
+    batch_size = batch_size or settings.MENU_PURGE_BATCH_SIZE
+    removed = Counter()
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.order_by('pk').values_list(
+                'pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            menu_pks, item_pks = (affected_pages(model, pks)
+                                  if signals.publishing() else ((), ()))
+            removed.update(delete_rows(model, pks))
+            signals.menus_changed(menu_pks=menu_pks, item_pks=item_pks)
+    return removed
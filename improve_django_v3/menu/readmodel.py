@@ -0,0 +1,283 @@
+'''This keeps an immutable in-memory copy of the current menus.
+
+The snapshot holds every current Menu with its Items and their
+Ingredients as named tuples indexed by pk, so menu_list, menu_detail and
+item_detail can be served with a single small query instead of building
+model instances. Readers only ever read the module level reference, so
+they take no lock.
+
+The ReadModelVersion row counts changes. menu.signals bumps it inside
+every transaction that writes Menus, Items or Ingredients, so it commits
+together with the change. Readers compare it with the version their
+process built the snapshot from. They read it through the router, so a
+public page can take it from a replica, and each process keeps the
+number for MENU_READ_MODEL_VERSION_TTL seconds. A change committed by
+another process is therefore seen that much later, plus the replica lag.
+A snapshot of an older version, or one past the first expiration_date
+it contains, is not used: the first reader to find it stale rebuilds it
+if no rebuild is already running and reads from the ORM otherwise. A
+change committed in this process drops the kept number and starts a
+rebuild in the background. Writes that send no signals, like
+QuerySet.update(), have to call bump_version() themselves.
+
+The snapshot is always built from the default database, never a replica.
+Inside a transaction, or in a with disabled(): block, the views use the
+ORM. Set MENU_READ_MODEL = False to always use the ORM.
+'''
+import datetime
+import logging
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Item, Menu, ReadModelVersion
+
+logger = logging.getLogger(__name__)
+
+
+class Related(tuple):
+    '''This is a tuple that templates can call .all on like a manager.'''
+    __slots__ = ()
+
+    def all(self):
+        return self
+
+
+class IngredientView(namedtuple('IngredientView', 'pk name')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+
+class ItemView(namedtuple('ItemView', 'pk name description chef chef_id '
+                                      'created_date standard ingredients')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+
+class MenuView(namedtuple('MenuView', 'pk season created_date '
+                                      'expiration_date items')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.season
+
+
+Snapshot = namedtuple('Snapshot', 'menus menus_by_pk items_by_pk version '
+                                  'valid_until build_seconds size')
+
+_snapshot = None
+_rebuild_lock = threading.Lock()
+_rollover_timer = None
+_local = threading.local()
+# This is the last version read and the time.monotonic() it is kept until.
+_version = None
+
+
+def current_version(using=None):
+    '''This reads how many changes have been committed to the menus.'''
+    return ReadModelVersion.objects.using(using).filter(
+        pk=1).values_list('number', flat=True).first() or 0
+
+
+def latest_version():
+    '''This returns current_version(), reading it at most once every
+    MENU_READ_MODEL_VERSION_TTL seconds in each process.'''
+    global _version
+    now = time.monotonic()
+    kept = _version
+    if kept is not None and now < kept[1]:
+        return kept[0]
+    version = current_version()
+    _version = (version, now + settings.MENU_READ_MODEL_VERSION_TTL)
+    return version
+
+
+def forget_version():
+    '''This makes the next reader read the version again.'''
+    global _version
+    _version = None
+
+
+def bump_version():
+    '''This marks every process's snapshot as out of date once the
+    current transaction commits.'''
+    versions = ReadModelVersion.objects.using(DEFAULT_DB_ALIAS)
+    if not versions.filter(pk=1).update(number=F('number') + 1):
+        versions.get_or_create(pk=1, defaults={'number': 1})
+
+
+@contextmanager
+def disabled():
+    '''This makes get_snapshot() send the views to the ORM, for callers
+    that must see the database as it is right now.'''
+    previous = getattr(_local, 'disabled', False)
+    _local.disabled = True
+    try:
+        yield
+    finally:
+        _local.disabled = previous
+
+
+def deep_size(value, seen=None):
+    '''This adds up the memory used by a snapshot and everything in it.'''
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(deep_size(part, seen) for part in value)
+    elif isinstance(value, (dict, MappingProxyType)):
+        size += sum(deep_size(key, seen) + deep_size(part, seen)
+                    for key, part in value.items())
+    return size
+
+
+@transaction.atomic(using=DEFAULT_DB_ALIAS)
+def build():
+    '''This reads the current menus from the default database into a
+    Snapshot.'''
+    start = time.perf_counter()
+    today = datetime.date.today()
+    # The version is read first, so a change committed while the rest is
+    # read only makes the snapshot look older than it is.
+    version = current_version(using=DEFAULT_DB_ALIAS)
+
+    item_ingredient_rows = Item.ingredients.through.objects.using(
+        DEFAULT_DB_ALIAS).filter(
+        item__items__expiration_date__gte=today
+    ).distinct().order_by('ingredient_id').values_list(
+        'item_id', 'ingredient_id', 'ingredient__name')
+    item_rows = Item.objects.using(DEFAULT_DB_ALIAS).filter(
+        items__expiration_date__gte=today
+    ).distinct().values_list(
+        'pk', 'name', 'description', 'chef__username', 'chef_id',
+        'created_date', 'standard')
+    menu_item_rows = Menu.items.through.objects.using(
+        DEFAULT_DB_ALIAS).filter(
+        menu__expiration_date__gte=today
+    ).order_by('item_id').values_list('menu_id', 'item_id')
+    menu_rows = Menu.objects.using(DEFAULT_DB_ALIAS).filter(
+        expiration_date__gte=today
+    ).order_by('expiration_date', 'pk').values_list(
+        'pk', 'season', 'created_date', 'expiration_date')
+
+    ingredients = {}
+    item_ingredients = {}
+    for item_pk, pk, name in item_ingredient_rows:
+        ingredient = ingredients.setdefault(pk, IngredientView(pk, name))
+        item_ingredients.setdefault(item_pk, []).append(ingredient)
+
+    items_by_pk = {}
+    for pk, name, description, chef, chef_id, created_date, standard in \
+            item_rows:
+        items_by_pk[pk] = ItemView(
+            pk, name, description, chef, chef_id, created_date, standard,
+            Related(item_ingredients.get(pk, ())))
+
+    menu_items = {}
+    for menu_pk, item_pk in menu_item_rows:
+        # An Item added since it was read is left for the next rebuild.
+        if item_pk in items_by_pk:
+            menu_items.setdefault(menu_pk, []).append(items_by_pk[item_pk])
+
+    menus = tuple(
+        MenuView(pk, season, created_date, expiration_date,
+                 Related(menu_items.get(pk, ())))
+        for pk, season, created_date, expiration_date in menu_rows)
+
+    menus_by_pk = MappingProxyType({menu.pk: menu for menu in menus})
+    items_by_pk = MappingProxyType(items_by_pk)
+    snapshot = Snapshot(
+        menus, menus_by_pk, items_by_pk, version,
+        menus[0].expiration_date if menus else None,
+        time.perf_counter() - start, 0)
+    return snapshot._replace(size=deep_size(snapshot))
+
+
+def is_fresh(snapshot, version):
+    '''This tells if a snapshot still matches the database at version.
+    A replica behind the snapshot reports an older version.'''
+    return (snapshot is not None and snapshot.version >= version and
+            (snapshot.valid_until is None or
+             datetime.date.today() <= snapshot.valid_until))
+
+
+def rebuild():
+    '''This builds a new snapshot and swaps it in. The caller must hold
+    _rebuild_lock.'''
+    global _snapshot
+    snapshot = build()
+    _snapshot = snapshot
+    schedule_rollover(snapshot)
+    logger.info('Rebuilt the menu read model: %s menus, %s items, %s bytes '
+                'in %.3fs', len(snapshot.menus), len(snapshot.items_by_pk),
+                snapshot.size, snapshot.build_seconds)
+    return snapshot
+
+
+def refresh():
+    '''This rebuilds the snapshot from a background thread unless another
+    thread is already doing it.'''
+    if not _rebuild_lock.acquire(blocking=False):
+        return
+    try:
+        rebuild()
+    except Exception:
+        logger.exception('Could not rebuild the menu read model')
+    finally:
+        _rebuild_lock.release()
+        connections[DEFAULT_DB_ALIAS].close()
+
+
+def refresh_in_background():
+    '''This starts a rebuild without making the caller wait for it,
+    unless one is already running.'''
+    if not _rebuild_lock.locked():
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+def schedule_rollover(snapshot):
+    '''This rebuilds the snapshot at the midnight its first menu expires.'''
+    global _rollover_timer
+    if _rollover_timer is not None:
+        _rollover_timer.cancel()
+        _rollover_timer = None
+    if snapshot.valid_until is None:
+        return
+
+    rollover = timezone.make_aware(datetime.datetime.combine(
+        snapshot.valid_until + datetime.timedelta(1), datetime.time.min))
+    delay = max((rollover - timezone.now()).total_seconds(), 0)
+    _rollover_timer = threading.Timer(delay, refresh)
+    _rollover_timer.daemon = True
+    _rollover_timer.start()
+
+
+def get_snapshot():
+    '''This returns an up to date snapshot, or None when the caller should
+    read from the ORM instead.'''
+    if not settings.MENU_READ_MODEL or getattr(_local, 'disabled', False) or \
+            connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    snapshot = _snapshot
+    if is_fresh(snapshot, latest_version()):
+        return snapshot
+    if not _rebuild_lock.acquire(blocking=False):
+        return None
+    try:
+        return rebuild()
+    finally:
+        _rebuild_lock.release()
@@ -0,0 +1,70 @@
+'''This fills the database with a made up catalogue for benchmarks.'''
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Ingredient, Item, Menu
+
+WORDS = (
+    'apple banana caramel cherry chocolate cinnamon cream fudge ginger '
+    'hazelnut honey lemon malt maple mint nutmeg orange peach peanut '
+    'pecan pumpkin raspberry root strawberry toffee vanilla walnut'
+).split()
+
+SEASONS = ('Spring', 'Summer', 'Fall', 'Winter', "Chef's special")
+
+
+@transaction.atomic
+def seed_catalogue(items=1000, menus=50, ingredients=200, chefs=10,
+                   items_per_menu=20, seed=0):
+    '''This creates chefs, ingredients, items and menus in bulk. Half of
+    the menus are current and half have expired. The same seed always
+    gives the same catalogue.'''
+    rng = random.Random(seed)
+    today = datetime.date.today()
+
+    start = User.objects.count()
+    User.objects.bulk_create(
+        User(username='chef{}'.format(start + number))
+        for number in range(chefs))
+    chef_pks = list(User.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:chefs])
+
+    Ingredient.objects.bulk_create(
+        Ingredient(name=' '.join(rng.sample(WORDS, 2)))
+        for _ in range(ingredients))
+    ingredient_pks = list(Ingredient.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:ingredients])
+
+    Item.objects.bulk_create(
+        Item(name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+             description=' '.join(rng.choice(WORDS) for _ in range(40)),
+             chef_id=rng.choice(chef_pks),
+             created_date=today - datetime.timedelta(rng.randrange(730)),
+             standard=rng.random() < 0.2)
+        for _ in range(items))
+    item_pks = list(Item.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:items])
+
+    Through = Item.ingredients.through
+    Through.objects.bulk_create(
+        Through(item_id=item_pk, ingredient_id=ingredient_pk)
+        for item_pk in item_pks
+        for ingredient_pk in rng.sample(ingredient_pks,
+                                        min(5, len(ingredient_pks))))
+
+    Menu.objects.bulk_create(
+        Menu(season=rng.choice(SEASONS),
+             expiration_date=today + datetime.timedelta(
+                 rng.randrange(1, 365) * (1 if number % 2 else -1)))
+        for number in range(menus))
+    menu_pks = list(Menu.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:menus])
+
+    Through = Menu.items.through
+    Through.objects.bulk_create(
+        Through(menu_id=menu_pk, item_id=item_pk)
+        for menu_pk in menu_pks
+        for item_pk in rng.sample(item_pks, min(items_per_menu, items)))
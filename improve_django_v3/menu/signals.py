@@ -0,0 +1,177 @@
+'''These signal handlers keep derived copies of the menus up to date.
+
+The pks a transaction touches are collected and handed on once, when it
+commits, however many signals it sends.'''
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+
+from . import readmodel
+from .jobs import enqueue
+from .models import Ingredient, Item, Menu
+
+_state = threading.local()
+
+
+def publishing():
+    '''This tells if pages are republished when menus change, which is
+    the only thing that needs the changed pks.'''
+    return getattr(settings, 'MENU_PUBLISH_ON_SAVE', False)
+
+
+def tracking():
+    '''This tells if anything wants to hear about changed menus.'''
+    return settings.MENU_READ_MODEL or publishing()
+
+
+class PendingChanges(object):
+    '''This collects the pks changed in one transaction and passes them
+    on when it commits.'''
+
+    def __init__(self):
+        self.menu_pks = set()
+        self.item_pks = set()
+
+    def __call__(self):
+        if _state.__dict__.get('pending') is self:
+            del _state.pending
+        if settings.MENU_READ_MODEL:
+            readmodel_changed()
+        if publishing():
+            enqueue('menu.publish.publish_pages',
+                    sorted(self.menu_pks), sorted(self.item_pks))
+
+
+def pending_changes():
+    '''This returns the PendingChanges of the current transaction,
+    registering a new one if it has none yet.'''
+    connection = transaction.get_connection()
+    pending = getattr(_state, 'pending', None)
+    # A rolled back transaction drops its on_commit callbacks.
+    if pending is None or not any(
+            callback is pending for _, callback in connection.run_on_commit):
+        pending = PendingChanges()
+        if settings.MENU_READ_MODEL:
+            # This commits, or rolls back, together with the change.
+            readmodel.bump_version()
+        if connection.in_atomic_block:
+            _state.pending = pending
+            transaction.on_commit(pending)
+    return pending
+
+
+def menus_changed(menu_pks=(), item_pks=()):
+    '''This is called for every write that touches Menus or Items, with
+    the pks of the pages that need to be refreshed.'''
+    if not tracking():
+        return
+    pending = pending_changes()
+    pending.menu_pks.update(menu_pks)
+    pending.item_pks.update(item_pks)
+    if not transaction.get_connection().in_atomic_block:
+        # In autocommit mode the write has already been committed.
+        pending()
+
+
+def readmodel_changed():
+    '''This starts building a snapshot with the committed change.'''
+    readmodel.forget_version()
+    readmodel.refresh_in_background()
+
+
+@receiver(pre_delete, sender=Menu)
+def remember_menu_items(sender, instance, **kwargs):
+    '''This keeps the Items of a Menu around until it has been deleted.'''
+    if publishing():
+        instance._item_pks = list(instance.items.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+def menu_saved(sender, instance, **kwargs):
+    if not publishing():
+        return menus_changed()
+    item_pks = getattr(instance, '_item_pks', None)
+    if item_pks is None:
+        item_pks = instance.items.values_list('pk', flat=True)
+    menus_changed(menu_pks=[instance.pk], item_pks=item_pks)
+
+
+@receiver(pre_delete, sender=Item)
+def remember_item_menus(sender, instance, **kwargs):
+    '''This keeps the Menus of an Item around until it has been deleted.'''
+    if publishing():
+        instance._menu_pks = list(instance.items.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_saved(sender, instance, **kwargs):
+    if not publishing():
+        return menus_changed()
+    menu_pks = getattr(instance, '_menu_pks', None)
+    if menu_pks is None:
+        menu_pks = instance.items.values_list('pk', flat=True)
+    menus_changed(menu_pks=menu_pks, item_pks=[instance.pk])
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_items(sender, instance, **kwargs):
+    '''This keeps the Items of an Ingredient around until it has been
+    deleted.'''
+    if publishing():
+        instance._item_pks = list(
+            instance.item_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_saved(sender, instance, **kwargs):
+    if not publishing():
+        return menus_changed()
+    item_pks = getattr(instance, '_item_pks', None)
+    if item_pks is None:
+        item_pks = list(instance.item_set.values_list('pk', flat=True))
+    menus_changed(
+        menu_pks=Menu.objects.filter(items__in=item_pks).values_list(
+            'pk', flat=True),
+        item_pks=item_pks)
+
+
+@receiver(m2m_changed, sender=Menu.items.through)
+def menu_items_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not publishing():
+        if action.startswith('post_'):
+            menus_changed()
+        return
+    if action == 'pre_clear':
+        # Both sides of this relation are called items.
+        instance._cleared_pks = list(
+            instance.items.values_list('pk', flat=True))
+    if not action.startswith('post_'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', ())
+    if reverse:
+        menus_changed(menu_pks=pk_set or (), item_pks=[instance.pk])
+    else:
+        menus_changed(menu_pks=[instance.pk], item_pks=pk_set or ())
+
+
+@receiver(m2m_changed, sender=Item.ingredients.through)
+def item_ingredients_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not publishing():
+        return menus_changed()
+    items = Item.objects.filter(pk__in=pk_set or ()) if reverse else [instance]
+    item_pks = [item.pk for item in items]
+    menus_changed(
+        menu_pks=Menu.objects.filter(items__in=item_pks).values_list(
+            'pk', flat=True),
+        item_pks=item_pks)
@@ -0,0 +1,27 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.utils.html import format_html_join
+
+from menu import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def css_bundle():
+    '''This links the fingerprinted CSS bundle. Until it has been built
+    each source is linked on its own, from the CDN if it is not vendored.'''
+    if assets.bundle_available():
+        urls = [static(settings.MENU_CSS_BUNDLE_NAME)]
+    else:
+        urls = []
+        for source in settings.MENU_CSS_BUNDLE:
+            if source in settings.MENU_VENDOR_ASSETS and \
+                    not finders.find(source):
+                urls.append(settings.MENU_VENDOR_ASSETS[source])
+            else:
+                urls.append(static(source))
+    return format_html_join(
+        '\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
@@ -1,12 +1,41 @@
 import datetime
+import gzip
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
 
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
 from django.contrib.auth.models import User
-from django.core.urlresolvers import reverse
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import resolve, reverse
+from django.db import IntegrityError, connection, connections
+from django.db.backends.utils import CursorWrapper
 from django.forms import ValidationError
-from django.test import TestCase, Client
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
+from django.test import (
+    Client, RequestFactory, TestCase, TransactionTestCase,
+    override_settings)
+from django.utils import timezone
+from django.utils.http import urlencode
 
-from .forms import MenuForm
-from .models import Ingredient, Item, Menu
+from mysite import routers, warmup
+
+from . import (
+    assets, jobs, publish, purge, readmodel, signals, throttle, views)
+from .forms import MenuForm, MenuFormSet, two_years_from_now
+from .middleware import (
+    CompressionMiddleware, minify_html, minify_html_sequence)
+from .models import Ingredient, Item, Job, Menu, ReadModelVersion
+from .seed import seed_catalogue
 
 
 class FormTests(TestCase):
@@ -154,6 +183,7 @@ class MenuViewsTests(TestCase):
     '''This tests to see if the menu views work.'''
     def setUp(self):
         '''This creates an Item and Ingredient object for the Menu model.'''
+        throttle.reset()
         # This creates a User model to attach to the Item model.
         self.user = User.objects.create_user(
             username='tester',
@@ -210,6 +240,28 @@ class MenuViewsTests(TestCase):
         self.assertContains(resp, 'Soda Fountain')
         self.assertContains(resp, 'Pumpkin pie')
 
+    @override_settings(MENU_STREAM_CHUNK_SIZE=2)
+    def test_item_list_stream_view(self):
+        '''This tests that every Item is streamed in created_date order
+        inside the page layout.'''
+        for day in (3, 1, 2, 1):
+            Item.objects.create(
+                name='Day {} pie'.format(day), description='Pie',
+                chef=self.user,
+                created_date=datetime.date(2018, 1, day))
+        resp = self.client.get(reverse('item_list_stream'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        chunks = [chunk.decode('utf-8') for chunk in resp.streaming_content]
+        self.assertIn('Soda Fountain', chunks[0])
+        content = ''.join(chunks)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+        positions = [content.index(name) for name in (
+            'Day 1 pie', 'Day 2 pie', 'Day 3 pie', 'Pumpkin pie')]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(content.count('Day 1 pie'), 2)
+
     def test_edit_menu_view(self):
         '''This tests the edit menu view and form.'''
         resp = self.client.get(reverse('menu_edit',
@@ -299,3 +351,1181 @@ class MenuViewsTests(TestCase):
         # Menu item created in this test 1 for setUp 1 for the POST
         self.assertRedirects(
             resp, reverse('menu_detail', kwargs={'pk': 2}))
+
+
+class PublishTests(TestCase):
+    '''This tests the static snapshot of the public menu pages.'''
+    def setUp(self):
+        '''This creates a current Menu with one Item and an output
+        directory for the pages.'''
+        self.user = User.objects.create_user(
+            username='tester',
+            email='test@test.com',
+            password='verysecret1'
+        )
+        self.item = Item.objects.create(
+            name='Pumpkin pie',
+            description='A kind of desert pumpkin, cinnamon, nutmed and more',
+            chef=self.user,
+            standard=True,
+        )
+        self.menu = Menu.objects.create(
+            season='Fall',
+            expiration_date=datetime.date.today() + datetime.timedelta(1)
+        )
+        self.menu.items.add(self.item)
+
+        self.publish_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.publish_root)
+        settings_override = override_settings(
+            MENU_PUBLISH_ROOT=self.publish_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def read_page(self, url):
+        '''This returns the plain and the gzipped copy of a page.'''
+        path = publish.page_path(url)
+        with open(path, 'rb') as page, gzip.open(path + '.gz') as page_gz:
+            return page.read(), page_gz.read()
+
+    def test_publish_all(self):
+        '''This tests that every current page is written with a .gz.'''
+        publish.publish_all()
+        content, compressed = self.read_page(reverse('menu_list'))
+        self.assertEqual(content, compressed)
+        self.assertIn(b'Fall', content)
+
+        content, _ = self.read_page(
+            reverse('menu_detail', kwargs={'pk': self.menu.pk}))
+        self.assertIn(b'Pumpkin pie', content)
+        content, _ = self.read_page(
+            reverse('item_detail', kwargs={'pk': self.item.pk}))
+        self.assertIn(b'Head Chef:', content)
+
+    def test_publish_pages_removes_expired_menu(self):
+        '''This tests that an incremental publish drops expired pages.'''
+        publish.publish_all()
+        self.menu.expiration_date = datetime.date.today() - \
+            datetime.timedelta(1)
+        self.menu.save()
+        publish.publish_pages(menu_pks=[self.menu.pk],
+                              item_pks=[self.item.pk])
+
+        for name, pk in (('menu_detail', self.menu.pk),
+                         ('item_detail', self.item.pk)):
+            url = reverse(name, kwargs={'pk': pk})
+            self.assertFalse(os.path.exists(publish.page_path(url)))
+        content, _ = self.read_page(reverse('menu_list'))
+        self.assertNotIn(b'Fall', content)
+
+    def test_next_rollover(self):
+        '''This tests that the rollover is the midnight after expiry.'''
+        rollover = publish.next_rollover()
+        self.assertEqual(rollover.date(), self.menu.expiration_date +
+                         datetime.timedelta(1))
+        Menu.objects.all().delete()
+        self.assertIsNone(publish.next_rollover())
+
+    def test_watch_sees_earlier_rollover(self):
+        '''This tests that --watch notices a menu saved during its sleep
+        that expires before the rollover it is waiting for.'''
+        later = publish.next_rollover()
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            if len(waits) == 1:
+                Menu.objects.create(season='Winter',
+                                    expiration_date=datetime.date.today())
+            else:
+                raise KeyboardInterrupt
+
+        out = StringIO()
+        with mock.patch('time.sleep', side_effect=sleep), \
+                self.assertRaises(KeyboardInterrupt):
+            call_command('publish_menus', watch=True, idle=60, stdout=out)
+        self.assertEqual(waits[0], 60)
+        self.assertLessEqual(waits[1], 60)
+        earlier = publish.next_rollover()
+        self.assertLess(earlier, later)
+        self.assertEqual(re.findall('Next rollover at (.*)', out.getvalue()),
+                         [str(later), str(earlier)])
+
+
+class SignalTests(TestCase):
+    '''This tests how writes to the menus are passed on.'''
+    def setUp(self):
+        '''This creates five Items to put on a Menu.'''
+        throttle.reset()
+        user = User.objects.create_user(username='tester', password='x')
+        self.items = [
+            Item.objects.create(name=str(i), description='', chef=user)
+            for i in range(5)]
+
+    def pending_changes(self):
+        return [callback for _, callback in connection.run_on_commit
+                if isinstance(callback, signals.PendingChanges)]
+
+    @override_settings(MENU_PUBLISH_ON_SAVE=True)
+    def test_one_callback_per_transaction(self):
+        '''This tests that saving a Menu with its Items republishes
+        its pages once.'''
+        self.client.post(reverse('menu_new'), {
+            'season': 'Spring',
+            'items': [item.pk for item in self.items],
+            'expiration_date': datetime.date.today(),
+        })
+        menu = Menu.objects.get()
+        pending = self.pending_changes()
+        self.assertEqual(len(pending), 1)
+        with mock.patch('menu.signals.enqueue') as enqueue:
+            pending[0]()
+        enqueue.assert_called_once_with(
+            'menu.publish.publish_pages', [menu.pk],
+            [item.pk for item in self.items])
+
+    @override_settings(MENU_PUBLISH_ON_SAVE=False, MENU_READ_MODEL=False)
+    def test_no_queries_without_consumers(self):
+        '''This tests that the handlers do no work when nothing listens.'''
+        before = self.pending_changes()
+        with self.assertNumQueries(1):
+            menu = Menu.objects.create(
+                season='Spring', expiration_date=datetime.date.today())
+        with self.assertNumQueries(1):
+            self.items[0].save()
+        menu.items.add(*self.items)
+        self.assertEqual(self.pending_changes(), before)
+
+
+class AssetTests(TestCase):
+    '''This tests the CSS bundle and how static files are served.'''
+    def test_minify_css(self):
+        '''This tests that comments and extra whitespace are removed.'''
+        css = '/* A comment */\n.logo {\n  text-align: center;\n}\n'
+        self.assertEqual(assets.minify_css(css), '.logo{text-align: center}')
+
+    def test_rebase_urls(self):
+        '''This tests that font urls still work from the bundle.'''
+        css = "src:url('../fonts/a.eot?#iefix'),url(data:x)"
+        self.assertEqual(
+            assets.rebase_urls(css, 'menu/vendor/bootstrap/css/b.css',
+                               'menu/css/bundle.min.css'),
+            "src:url('../vendor/bootstrap/fonts/a.eot?#iefix'),url(data:x)")
+
+    def test_css_bundle(self):
+        '''This tests that pages link the one bundle and no CDN.'''
+        resp = self.client.get(reverse('menu_list'))
+        self.assertContains(resp, 'menu/css/bundle.min.css', count=1)
+        self.assertNotContains(resp, 'global.css')
+        self.assertNotContains(resp, settings.BOOTSTRAP_CDN)
+
+    def test_bundle_is_up_to_date(self):
+        '''This tests that the committed bundle matches its sources.'''
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        with open(assets.build_bundle(output_dir), encoding='utf-8') as new:
+            with open(finders.find(settings.MENU_CSS_BUNDLE_NAME),
+                      encoding='utf-8') as committed:
+                committed = committed.read()
+                self.assertEqual(new.read(), committed,
+                                 'Run `manage.py build_assets`.')
+        self.assertIn('Licensed under MIT', committed)
+
+    @override_settings(MENU_CSS_BUNDLE_NAME='menu/css/missing.min.css')
+    def test_css_bundle_falls_back_to_sources(self):
+        '''This tests the links used before the bundle is built.'''
+        resp = self.client.get(reverse('menu_list'))
+        self.assertContains(resp, 'menu/css/global.css')
+        self.assertContains(
+            resp, 'menu/vendor/bootstrap/css/bootstrap.min.css')
+        self.assertNotContains(resp, settings.BOOTSTRAP_CDN)
+
+    @override_settings(
+        MENU_CSS_BUNDLE_NAME='menu/css/missing.min.css',
+        MENU_CSS_BUNDLE=('menu/vendor/missing.css',),
+        MENU_VENDOR_ASSETS={'menu/vendor/missing.css': '//cdn/missing.css'})
+    def test_css_bundle_falls_back_to_cdn(self):
+        '''This tests that an asset that is not vendored comes from its
+        CDN.'''
+        resp = self.client.get(reverse('menu_list'))
+        self.assertContains(resp, 'href="//cdn/missing.css"')
+
+    def test_bundle_built_later(self):
+        '''This tests that a bundle built after the first check is
+        found.'''
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with override_settings(STATIC_ROOT=static_root,
+                               MENU_CSS_BUNDLE_NAME='later.min.css'):
+            self.assertFalse(assets.bundle_available())
+            with open(os.path.join(static_root, 'later.min.css'), 'w'):
+                pass
+            self.assertTrue(assets.bundle_available())
+
+    def test_gzip_manifest_storage(self):
+        '''This tests that collectstatic writes a .gz of every hashed
+        file that gets smaller.'''
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        storage = assets.GzipManifestStaticFilesStorage(location=static_root)
+        css = b'.logo{text-align:center}\n' * 50
+        storage.save('big.css', ContentFile(css))
+        storage.save('small.css', ContentFile(b'a{}'))
+        list(storage.post_process({
+            'big.css': (storage, 'big.css'),
+            'small.css': (storage, 'small.css'),
+        }))
+
+        big = storage.stored_name('big.css')
+        self.assertRegex(big, assets.FINGERPRINT)
+        with gzip.open(storage.path(big) + '.gz') as compressed:
+            self.assertEqual(compressed.read(), css)
+        self.assertFalse(os.path.exists(
+            storage.path(storage.stored_name('small.css')) + '.gz'))
+
+    def test_serve_fingerprinted_gzip(self):
+        '''This tests that a fingerprinted file is served gzipped and
+        cached for a year.'''
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        name = 'bundle.0123456789ab.css'
+        with open(os.path.join(static_root, name), 'wb') as css:
+            css.write(b'.logo{text-align:center}')
+        with open(os.path.join(static_root, name + '.gz'), 'wb') as css:
+            css.write(gzip.compress(b'.logo{text-align:center}'))
+        with open(os.path.join(static_root, 'global.css'), 'wb') as css:
+            css.write(b'.logo{text-align:center}')
+
+        with override_settings(STATIC_ROOT=static_root):
+            request = RequestFactory().get(
+                '/static/' + name, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            resp = assets.serve(request, name)
+            plain = assets.serve(request, 'global.css')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Content-Type'], 'text/css')
+        self.assertIn('max-age=31536000', resp['Cache-Control'])
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertEqual(resp['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('max-age=300', plain['Cache-Control'])
+
+
+class CompressionTests(TestCase):
+    '''This tests the HTML minifier and the compression middleware.'''
+    html = ('<div>\n    <p>Pumpkin   pie</p>\n</div>\n'
+            '<pre>  keep\n    this</pre>\n    <textarea> and  this</textarea>')
+
+    def test_minify_html(self):
+        '''This tests that <pre> and <textarea> keep their whitespace.'''
+        self.assertEqual(
+            minify_html(self.html),
+            '<div>\n<p>Pumpkin pie</p>\n</div>\n'
+            '<pre>  keep\n    this</pre>\n<textarea> and  this</textarea>')
+
+    def test_minify_html_sequence(self):
+        '''This tests that chunks split inside a <pre> still match.'''
+        content = self.html.encode('utf-8')
+        chunks = [content[start:start + 7]
+                  for start in range(0, len(content), 7)]
+        self.assertEqual(
+            b''.join(minify_html_sequence(chunks, 'utf-8')).decode('utf-8'),
+            minify_html(self.html))
+
+    def test_minify_html_keeps_attributes(self):
+        '''This tests that whitespace inside a tag is left alone.'''
+        self.assertEqual(
+            minify_html('<input value="a  b" title=\'x > y\'>\n  <p>  a</p>'),
+            '<input value="a  b" title=\'x > y\'>\n<p> a</p>')
+
+    def test_no_compression_with_csrf_token(self):
+        '''This tests that pages holding a CSRF token are not gzipped.'''
+        resp = self.client.get(reverse('menu_new'),
+                               HTTP_ACCEPT_ENCODING='gzip')
+        self.assertContains(resp, 'csrfmiddlewaretoken')
+        self.assertFalse(resp.has_header('Content-Encoding'))
+        resp = self.client.get(reverse('menu_list'),
+                               HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+
+    def test_compression_threshold_and_type(self):
+        '''This tests that only long enough allowed types are gzipped.'''
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        middleware = CompressionMiddleware()
+        with override_settings(MENU_GZIP_MIN_LENGTH=500):
+            small = middleware.process_response(
+                request, HttpResponse('a' * 499))
+            large = middleware.process_response(
+                request, HttpResponse('a' * 500))
+            image = middleware.process_response(
+                request, HttpResponse(b'a' * 500, content_type='image/png'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertEqual(large['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(large.content), b'a' * 500)
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+    def test_compression_streaming(self):
+        '''This tests that streamed responses are gzipped chunk by chunk.'''
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = CompressionMiddleware().process_response(
+            request, StreamingHttpResponse(iter([b'a' * 10, b'b' * 10])))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b'a' * 10 + b'b' * 10)
+
+
+class WarmupTests(TestCase):
+    '''This tests the start up warmup in mysite.warmup.'''
+    def test_template_names(self):
+        '''This tests that only the menu templates are preloaded.'''
+        names = warmup.template_names()
+        self.assertIn('menu/layout.html', names)
+        self.assertIn('menu/item_list.html', names)
+        self.assertFalse([name for name in names
+                          if not name.startswith('menu/')])
+
+    def test_reverse_routes(self):
+        '''This tests that the menu and admin routes get reversed.'''
+        self.assertGreater(warmup.reverse_routes(), len(
+            ['menu_list', 'item_list', 'menu_edit', 'menu_detail',
+             'menu_delete', 'item_detail', 'menu_new', 'admin:index']))
+
+    def test_profile_settings(self):
+        '''This tests that only the dev profile runs with DEBUG on.'''
+        script = ('from django.conf import settings; '
+                  'print(settings.DEBUG, settings.MENU_SERVE_STATIC, '
+                  'settings.STATICFILES_STORAGE)')
+        for profile, expected in (
+                ('dev', 'True False django.contrib.staticfiles.storage.'
+                        'StaticFilesStorage'),
+                ('prod', 'False True menu.assets.'
+                         'GzipManifestStaticFilesStorage')):
+            env = dict(os.environ, DJANGO_PROFILE=profile,
+                       DJANGO_SETTINGS_MODULE='mysite.settings')
+            output = subprocess.check_output(
+                [sys.executable, '-c', script], env=env,
+                cwd=settings.BASE_DIR, universal_newlines=True)
+            self.assertEqual(output.strip(), expected)
+
+    def test_warmup(self):
+        '''This tests that every step runs and gets timed.'''
+        timings = warmup.warmup()
+        self.assertEqual([name for name, _ in timings],
+                         [name for name, _ in warmup.STEPS])
+
+
+class ThrottleTests(TestCase):
+    '''This tests the write rate limit and concurrency cap.'''
+    def setUp(self):
+        '''This starts every test with full rate limit buckets.'''
+        throttle.reset()
+
+    def test_token_bucket(self):
+        '''This tests that a bucket empties and then refills.'''
+        bucket = throttle.TokenBucket(rate=1, burst=2)
+        self.assertEqual(bucket.take(['a'], now=0), 0)
+        self.assertEqual(bucket.take(['a'], now=0), 0)
+        self.assertEqual(bucket.take(['a'], now=0), 1)
+        self.assertEqual(bucket.take(['b'], now=0), 0)
+        self.assertEqual(bucket.take(['a'], now=1), 0)
+
+    @override_settings(MENU_RATE_LIMIT={
+        'RATE': 0.001, 'BURST': 2, 'METHODS': ('POST',),
+        'VIEWS': ('menu_new',)})
+    def test_rate_limit_middleware(self):
+        '''This tests that a flood of posts gets a 429 without any
+        database work.'''
+        url = reverse('menu_new')
+        for _ in range(2):
+            self.client.post(url, {'season': 'Spring'},
+                             REMOTE_ADDR='10.0.0.1')
+        with self.assertNumQueries(0):
+            resp = self.client.post(url, {'season': 'Spring'},
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(resp.status_code, 429)
+        self.assertIn('Retry-After', resp)
+        self.assertEqual(throttle.stats(), {('rate', 'menu_new'): 1})
+        with self.assertLogs('menu.throttle') as logs:
+            self.client.post(url, {'season': 'Spring'},
+                             REMOTE_ADDR='10.0.0.1')
+            throttle.log_stats()
+        pid = os.getpid()
+        self.assertEqual([record.getMessage() for record in logs.records], [
+            'Shed rate request to menu_new (2 so far in worker {})'.format(
+                pid),
+            'Worker {} shed 2 rate requests to menu_new'.format(pid),
+        ])
+
+        # Reading the form and other clients are not affected.
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code, 200)
+        resp = self.client.post(url, {'season': 'Spring'},
+                                REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_reset(self):
+        '''This tests that reset() refills the buckets of every client.'''
+        bucket = throttle.get_bucket()
+        for _ in range(settings.MENU_RATE_LIMIT['BURST']):
+            bucket.take(['ip:127.0.0.1'])
+        self.assertTrue(bucket.take(['ip:127.0.0.1']))
+        throttle.reset()
+        self.assertIsNot(throttle.get_bucket(), bucket)
+        self.assertFalse(throttle.get_bucket().take(['ip:127.0.0.1']))
+
+    @override_settings(MENU_WRITE_CONCURRENCY=1)
+    def test_concurrency_limit(self):
+        '''This tests that requests past the cap get a 503 at once.'''
+        @throttle.concurrency_limit
+        def busy_view(request):
+            return HttpResponse()
+
+        # This holds the only slot as if another request were running.
+        semaphore = throttle.get_semaphore('busy_view', 1)
+        semaphore.acquire()
+        try:
+            resp = busy_view(RequestFactory().post('/'))
+        finally:
+            semaphore.release()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(busy_view(RequestFactory().post('/')).status_code,
+                         200)
+
+
+@override_settings(DATABASE_REPLICAS={'replica1': 2, 'replica2': 1})
+class ReplicaRouterTests(TestCase):
+    '''This tests which database the read views read from.'''
+    def setUp(self):
+        '''This configures two replica databases without connecting.'''
+        self.router = routers.ReplicaRouter()
+        self.middleware = routers.ReplicaMiddleware()
+        self.addCleanup(routers.reset_replica_flag)
+        for alias in ('replica1', 'replica2'):
+            connections.databases[alias] = dict(
+                connections.databases['default'], NAME=alias + '.sqlite3')
+            self.addCleanup(connections.databases.pop, alias)
+            self.addCleanup(connections._connections.__dict__.pop, alias,
+                            None)
+
+    def route(self, method, url, session=None):
+        '''This runs a request through the middleware and returns where a
+        Menu would be read from during its view.'''
+        request = getattr(RequestFactory(), method)(url)
+        request.session = session if session is not None else {}
+        if session is not None:
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+        request.resolver_match = resolve(url)
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, None, (), {})
+        return self.router.db_for_read(Menu), request
+
+    def test_choose_replica_by_weight(self):
+        '''This tests that replicas take turns in proportion to weight.'''
+        picks = [routers.choose_replica() for _ in range(6)]
+        self.assertEqual(picks.count('replica1'), 4)
+        self.assertEqual(picks.count('replica2'), 2)
+
+    def test_read_views_use_replicas(self):
+        '''This tests that only GETs to the read views use replicas.'''
+        self.assertIn(self.route('get', reverse('menu_list'))[0],
+                      ('replica1', 'replica2'))
+        self.assertIn(
+            self.route('get', reverse('admin:menu_menu_changelist'))[0],
+            ('replica1', 'replica2'))
+        self.assertEqual(
+            self.route('get', reverse('menu_edit', kwargs={'pk': 1}))[0],
+            'default')
+        self.assertEqual(self.route('post', reverse('menu_list'))[0],
+                         'default')
+        self.assertEqual(self.router.db_for_write(Menu), 'default')
+
+    def test_session_reads_its_writes(self):
+        '''This tests that a session reads from default after a write.'''
+        session = {}
+        _, request = self.route('post', reverse('menu_new'), session)
+        self.middleware.process_response(request, HttpResponse(status=302))
+        self.assertEqual(
+            self.route('get', reverse('menu_list'), session)[0], 'default')
+
+        session[routers.PIN_SESSION_KEY] = 0
+        self.assertNotEqual(
+            self.route('get', reverse('menu_list'), session)[0], 'default')
+
+    def test_public_pages_do_not_vary_on_cookie(self):
+        '''This tests that a client without a session cookie does not
+        have its session read.'''
+        connections.databases['replica1']['NAME'] = \
+            connections['default'].settings_dict['NAME']
+        with override_settings(DATABASE_REPLICAS={'replica1': 1}):
+            resp = self.client.get(reverse('menu_list'))
+        self.assertNotIn('Cookie', resp.get('Vary', ''))
+
+    def test_mirror_reads_from_default(self):
+        '''This tests that a replica of the same database is not used.'''
+        connections.databases['replica1']['NAME'] = \
+            connections['default'].settings_dict['NAME']
+        with override_settings(DATABASE_REPLICAS={'replica1': 1}):
+            self.assertEqual(self.route('get', reverse('menu_list'))[0],
+                             'default')
+
+
+job_calls = []
+
+
+def record_job(*args, **kwargs):
+    '''This is a job that remembers how it was called.'''
+    job_calls.append((args, kwargs))
+
+
+def failing_job():
+    '''This is a job that always fails.'''
+    raise ValueError('Out of pumpkins')
+
+
+class JobTests(TestCase):
+    '''This tests the background job queue.'''
+    def setUp(self):
+        del job_calls[:]
+
+    def test_enqueue_deduplicates_pending_jobs(self):
+        '''This tests that an identical pending job is only queued once.'''
+        job = jobs.enqueue('menu.tests.record_job', 1, season='Fall')
+        self.assertEqual(
+            jobs.enqueue('menu.tests.record_job', 1, season='Fall'), job)
+        self.assertNotEqual(
+            jobs.enqueue('menu.tests.record_job', 2, season='Fall'), job)
+
+        job.status = Job.DONE
+        job.save()
+        self.assertNotEqual(
+            jobs.enqueue('menu.tests.record_job', 1, season='Fall'), job)
+
+    def test_run_job(self):
+        '''This tests that a claimed job runs once and gets timed.'''
+        job = jobs.enqueue('menu.tests.record_job', [1, 2], season='Fall')
+        self.assertEqual(jobs.claim(10), [job.pk])
+        self.assertEqual(jobs.claim(10), [])
+        self.assertEqual(jobs.run_job(job.pk), Job.DONE)
+        self.assertEqual(job_calls, [(([1, 2],), {'season': 'Fall'})])
+
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.duration)
+        self.assertIsNotNone(job.finished_date)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=60)
+    def test_failed_job_is_retried_with_backoff(self):
+        '''This tests that a failing job waits, retries and then fails.'''
+        job = jobs.enqueue('menu.tests.failing_job')
+        jobs.claim(1)
+        self.assertEqual(jobs.run_job(job.pk), Job.PENDING)
+        job.refresh_from_db()
+        self.assertIn('Out of pumpkins', job.last_error)
+        self.assertGreater(job.run_after, timezone.now() +
+                           datetime.timedelta(seconds=50))
+        self.assertEqual(jobs.claim(1), [])
+
+        Job.objects.update(run_after=timezone.now())
+        jobs.claim(1)
+        self.assertEqual(jobs.run_job(job.pk), Job.FAILED)
+
+    @override_settings(JOB_TIMEOUT=60, JOB_RETRY_DELAY=0)
+    def test_expired_claim_is_retried(self):
+        '''This tests that a job whose worker died is run again, or
+        failed once it is out of attempts.'''
+        job = jobs.enqueue('menu.tests.record_job', 1)
+        dead = jobs.enqueue('menu.tests.record_job', 2)
+        self.assertEqual(jobs.claim(2), [job.pk, dead.pk])
+        Job.objects.filter(pk=dead.pk).update(max_attempts=1)
+        self.assertEqual(jobs.claim(2), [])
+
+        Job.objects.update(
+            started_date=timezone.now() - datetime.timedelta(seconds=61))
+        self.assertEqual(jobs.claim(2), [job.pk])
+        job.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('Timed out', job.last_error)
+        self.assertEqual(dead.status, Job.FAILED)
+
+    def test_bad_arguments_are_a_failed_attempt(self):
+        '''This tests that a job that cannot even start is retried.'''
+        job = jobs.enqueue('menu.tests.record_job')
+        Job.objects.update(arguments='{')
+        jobs.claim(1)
+        self.assertEqual(jobs.run_job(job.pk), Job.PENDING)
+        job.refresh_from_db()
+        self.assertIn('JSONDecodeError', job.last_error)
+
+
+class JobWorkerTests(TransactionTestCase):
+    '''This tests the run_worker command. Its threads use their own
+    database connections, so the jobs have to be committed.'''
+    def setUp(self):
+        del job_calls[:]
+
+    def test_run_worker_once(self):
+        '''This tests that the worker runs every due job and stops.'''
+        for number in range(3):
+            jobs.enqueue('menu.tests.record_job', number)
+        call_command('run_worker', once=True, workers=2, stdout=StringIO())
+        self.assertEqual(sorted(call[0][0] for call in job_calls), [0, 1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+
+
+class ChefViewsTests(TestCase):
+    '''This tests the chef dashboard and the chef summary.'''
+    def setUp(self):
+        '''This gives a chef three Items on a current and an expired
+        Menu.'''
+        self.chef = User.objects.create_user(username='head', password='x')
+        User.objects.create_user(username='idle', password='x')
+        pumpkin = Ingredient.objects.create(name='Pumpkin')
+        sugar = Ingredient.objects.create(name='Sugar')
+        self.items = []
+        for name in ('Pumpkin pie', 'Pumpkin soup', 'Sugar cube'):
+            item = Item.objects.create(name=name, description=name,
+                                       chef=self.chef)
+            item.ingredients.add(pumpkin, sugar)
+            self.items.append(item)
+
+        today = datetime.date.today()
+        current = Menu.objects.create(
+            season='Fall', expiration_date=today)
+        expired = Menu.objects.create(
+            season='Summer', expiration_date=today - datetime.timedelta(1))
+        current.items.add(*self.items[:2])
+        expired.items.add(*self.items)
+
+    def test_chef_list_view(self):
+        '''This tests that every chef is summed up in one query.'''
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('chef_list'))
+        chefs = list(resp.context['chefs'])
+        self.assertEqual(len(chefs), 1)
+        self.assertEqual(chefs[0]['chef__username'], 'head')
+        self.assertEqual(chefs[0]['item_count'], 3)
+        self.assertEqual(chefs[0]['current_menu_count'], 1)
+        self.assertEqual(chefs[0]['ingredient_count'], 2)
+
+    @override_settings(MENU_CHEF_PAGE_SIZE=2)
+    def test_chef_dashboard_view(self):
+        '''This tests the counts and the keyset pages of the dashboard.'''
+        url = reverse('chef_dashboard', kwargs={'pk': self.chef.pk})
+        with self.assertNumQueries(3):
+            resp = self.client.get(url)
+        self.assertTemplateUsed(resp, 'menu/chef_dashboard.html')
+        items = resp.context['items']
+        self.assertEqual([item.name for item in items],
+                         ['Pumpkin pie', 'Pumpkin soup'])
+        self.assertEqual([item.current_menu_count for item in items], [1, 1])
+        self.assertEqual([item.ingredient_count for item in items], [2, 2])
+        self.assertContains(resp, 'Pumpkin, Sugar')
+        self.assertEqual(resp.context['next_after'], self.items[1].pk)
+
+        resp = self.client.get(url, {'after': resp.context['next_after']})
+        items = resp.context['items']
+        self.assertEqual([item.name for item in items], ['Sugar cube'])
+        self.assertEqual(items[0].current_menu_count, 0)
+        self.assertIsNone(resp.context['next_after'])
+
+    def test_bad_chef_dashboard_view(self):
+        '''This tests an invalid chef pk in the chef dashboard.'''
+        resp = self.client.get(reverse('chef_dashboard', kwargs={'pk': 1204}))
+        self.assertEqual(resp.status_code, 404)
+
+
+def bulk_menu_data(rows):
+    '''This builds the POST data of the bulk menu form from a list of
+    (season, item pks) rows.'''
+    expires = datetime.date.today() + datetime.timedelta(30)
+    data = {
+        'form-TOTAL_FORMS': len(rows),
+        'form-INITIAL_FORMS': 0,
+        'form-MAX_NUM_FORMS': 1000,
+    }
+    for i, (season, item_pks) in enumerate(rows):
+        data.update({
+            'form-{}-season'.format(i): season,
+            'form-{}-items'.format(i): item_pks,
+            'form-{}-expiration_date_year'.format(i): expires.year,
+            'form-{}-expiration_date_month'.format(i): expires.month,
+            'form-{}-expiration_date_day'.format(i): expires.day,
+        })
+    return data
+
+
+class BulkMenuTests(TestCase):
+    '''This tests creating many Menus from the bulk menu form.'''
+    def setUp(self):
+        '''This creates the Items the new Menus can list.'''
+        throttle.reset()
+        user = User.objects.create_user(username='tester', password='x')
+        self.items = [
+            Item.objects.create(name=name, description=name, chef=user)
+            for name in ('Pumpkin pie', 'Apple pie', 'Cherry pie')]
+        self.url = reverse('menu_bulk_new')
+
+    def test_bulk_menu_view(self):
+        '''This tests that the Items of every row are read once.'''
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url)
+        self.assertTemplateUsed(resp, 'menu/menu_bulk_new.html')
+        self.assertContains(resp, 'Cherry pie', count=10)
+
+    def test_bulk_create_menus(self):
+        '''This tests that 50 Menus are saved with a handful of queries
+        and that the public pages hear about them.'''
+        pks = [item.pk for item in self.items]
+        rows = [('Week {}'.format(i), pks[:i % 3 + 1]) for i in range(50)]
+        with mock.patch('menu.signals.menus_changed') as menus_changed:
+            with self.assertNumQueries(7):
+                resp = self.client.post(self.url, bulk_menu_data(rows))
+        self.assertRedirects(resp, reverse('menu_list'))
+
+        menus = Menu.objects.order_by('pk').prefetch_related('items')
+        self.assertEqual(
+            [(menu.season, [item.pk for item in menu.items.all()])
+             for menu in menus],
+            [(season, sorted(item_pks)) for season, item_pks in rows])
+        menu_pks, item_pks = menus_changed.call_args[0]
+        self.assertEqual(menu_pks, [menu.pk for menu in menus])
+        self.assertEqual(set(item_pks), set(pks))
+
+    def test_bulk_menu_errors(self):
+        '''This tests that a bad row saves nothing and is reported.'''
+        rows = [('Spring', [self.items[0].pk]),
+                ('Summer!', [self.items[1].pk]),
+                ('Fall', [self.items[2].pk, 1204])]
+        with self.assertNumQueries(2):
+            resp = self.client.post(self.url, bulk_menu_data(rows))
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(Menu.objects.exists())
+        errors = resp.context['formset'].errors
+        self.assertEqual(errors[0], {})
+        self.assertIn('season', errors[1])
+        self.assertIn('items', errors[2])
+
+    def test_read_back_mismatch(self):
+        '''This tests that a Menu from another writer with the same
+        created_date rolls the whole save back.'''
+        data = bulk_menu_data([('Spring', [self.items[0].pk])])
+        formset = MenuFormSet(QueryDict(urlencode(data, doseq=True)))
+        self.assertTrue(formset.is_valid())
+        bulk_create = Menu.objects.bulk_create
+
+        def racing_bulk_create(menus):
+            bulk_create(menus)
+            menu = menus[0]
+            Menu.objects.create(season='Other',
+                                expiration_date=menu.expiration_date,
+                                created_date=menu.created_date)
+
+        with mock.patch.object(Menu.objects, 'bulk_create',
+                               side_effect=racing_bulk_create), \
+                self.assertRaises(IntegrityError):
+            formset.save()
+        self.assertFalse(Menu.objects.exists())
+
+    def test_blank_rows_are_left_out(self):
+        '''This tests that untouched rows do not make Menus.'''
+        data = bulk_menu_data([('Spring', [self.items[0].pk])])
+        expires = two_years_from_now()
+        for i in (1, 2):
+            data.update({
+                'form-{}-expiration_date_year'.format(i): expires.year,
+                'form-{}-expiration_date_month'.format(i): expires.month,
+                'form-{}-expiration_date_day'.format(i): expires.day,
+            })
+        data['form-TOTAL_FORMS'] = 3
+        resp = self.client.post(self.url, data)
+        self.assertRedirects(resp, reverse('menu_list'))
+        self.assertEqual(Menu.objects.count(), 1)
+
+
+class PurgeTests(TestCase):
+    '''This tests deleting Menus, Items and Ingredients in bulk.'''
+    def setUp(self):
+        '''This creates two expired Menus, a current one, and an Item and
+        Ingredient nothing uses.'''
+        user = User.objects.create_user(username='tester', password='x')
+        self.pumpkin = Ingredient.objects.create(name='Pumpkin')
+        self.unused_ingredient = Ingredient.objects.create(name='Saffron')
+        self.items = []
+        for name in ('Pumpkin pie', 'Pumpkin soup', 'Ice cream'):
+            item = Item.objects.create(name=name, description=name,
+                                       chef=user)
+            item.ingredients.add(self.pumpkin)
+            self.items.append(item)
+        self.unused_item = Item.objects.create(
+            name='Fruit cake', description='Nobody wants it', chef=user)
+
+        today = datetime.date.today()
+        self.expired = []
+        for season in ('Summer', 'Spring'):
+            menu = Menu.objects.create(
+                season=season, expiration_date=today - datetime.timedelta(1))
+            menu.items.add(*self.items)
+            self.expired.append(menu)
+        self.current = Menu.objects.create(season='Fall',
+                                           expiration_date=today)
+        self.current.items.add(self.items[0])
+
+    @override_settings(MENU_PUBLISH_ON_SAVE=True)
+    def test_purge_menus(self):
+        '''This tests that each batch deletes through-table rows and
+        Menus and refreshes their pages once.'''
+        menus = purge.select_menus(before=datetime.date.today())
+        with mock.patch('menu.signals.menus_changed') as menus_changed:
+            removed = purge.purge(menus, batch_size=1)
+        self.assertEqual(removed, {'menu_menu': 2, 'menu_menu_items': 6})
+        self.assertEqual(list(Menu.objects.all()), [self.current])
+        self.assertEqual(Item.objects.count(), 4)
+        self.assertEqual(
+            [call[1] for call in menus_changed.call_args_list],
+            [{'menu_pks': [menu.pk], 'item_pks': set(
+                item.pk for item in self.items)} for menu in self.expired])
+
+    def test_purge_season(self):
+        '''This tests the season filter and the number of queries.'''
+        with self.assertNumQueries(8):
+            removed = purge.purge(purge.select_menus(season='Spring'))
+        self.assertEqual(removed, {'menu_menu': 1, 'menu_menu_items': 3})
+        self.assertFalse(Menu.objects.filter(season='Spring').exists())
+
+    @override_settings(MENU_PUBLISH_ON_SAVE=True)
+    def test_purge_unused(self):
+        '''This tests deleting Items and Ingredients nothing uses.'''
+        Menu.objects.all().delete()
+        with mock.patch('menu.signals.menus_changed') as menus_changed:
+            removed = purge.purge(purge.unused_items())
+        self.assertEqual(removed, {'menu_item': 4, 'menu_menu_items': 0,
+                                   'menu_item_ingredients': 3})
+        self.assertEqual(menus_changed.call_args[1]['menu_pks'], set())
+        removed = purge.purge(purge.unused_ingredients())
+        self.assertEqual(removed, {'menu_ingredient': 2,
+                                   'menu_item_ingredients': 0})
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_dry_run(self):
+        '''This tests that a dry run only counts.'''
+        counts = purge.purge(purge.unused_items(), dry_run=True)
+        self.assertEqual(counts, {'menu_item': 1, 'menu_menu_items': 0,
+                                  'menu_item_ingredients': 0})
+        self.assertTrue(Item.objects.filter(pk=self.unused_item.pk).exists())
+
+    def test_purge_command(self):
+        '''This tests the purge management command.'''
+        out = StringIO()
+        call_command('purge', expired_before=datetime.date.today(),
+                     unused_items=True, unused_ingredients=True, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Deleted 2 rows from menu_menu',
+            'Deleted 6 rows from menu_menu_items',
+            'Deleted 3 rows from menu_item',
+            'Deleted 2 rows from menu_item_ingredients',
+            'Deleted 0 rows from menu_menu_items',
+            'Deleted 1 rows from menu_ingredient',
+            'Deleted 0 rows from menu_item_ingredients',
+        ])
+        self.assertEqual(Item.objects.count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('purge')
+
+    def test_admin_purge_action(self):
+        '''This tests that the bulk delete action of the admin asks first
+        and replaces Django's own.'''
+        User.objects.create_superuser('admin', 'admin@test.com', 'x')
+        self.client.login(username='admin', password='x')
+        url = reverse('admin:menu_ingredient_changelist')
+        data = {'action': 'purge_selected',
+                '_selected_action': [self.pumpkin.pk]}
+        resp = self.client.post(url, data)
+        self.assertContains(resp, '1 from menu_ingredient')
+        self.assertContains(resp, '3 from menu_item_ingredients')
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+        resp = self.client.post(url, dict(data, post='yes'), follow=True)
+        self.assertContains(resp, 'Deleted 1 from menu_ingredient, '
+                                  '3 from menu_item_ingredients')
+        self.assertEqual(list(Ingredient.objects.all()),
+                         [self.unused_ingredient])
+        self.assertNotContains(self.client.get(url), 'delete_selected')
+
+    def test_admin_delete_view(self):
+        '''This tests that deleting one row in the admin counts what it
+        deletes instead of listing every related row.'''
+        User.objects.create_superuser('admin', 'admin@test.com', 'x')
+        self.client.login(username='admin', password='x')
+        url = reverse('admin:menu_menu_delete', args=[self.current.pk])
+        resp = self.client.get(url)
+        self.assertContains(resp, '1 from menu_menu')
+        self.assertContains(resp, '1 from menu_menu_items')
+        self.assertNotContains(resp, str(self.items[0]))
+
+        with mock.patch('menu.purge.delete_rows',
+                        side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.client.post(url, {'post': 'yes'})
+        self.assertFalse(LogEntry.objects.exists())
+
+        resp = self.client.post(url, {'post': 'yes'})
+        self.assertRedirects(resp, reverse('admin:menu_menu_changelist'))
+        self.assertFalse(Menu.objects.filter(pk=self.current.pk).exists())
+        self.assertEqual(LogEntry.objects.get().object_id,
+                         str(self.current.pk))
+
+
+class ReadModelTests(TransactionTestCase):
+    '''This tests the in-memory snapshot of the current menus. It only
+    holds committed data, so these tests commit theirs.'''
+    def setUp(self):
+        '''This creates a current and an expired Menu and keeps rebuilds
+        in the test's own thread.'''
+        patcher = mock.patch.object(readmodel, 'refresh_in_background')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Flushing the tables between tests restarts the version count, so
+        # a snapshot or version left by an earlier test could look current.
+        readmodel._snapshot = None
+        readmodel.forget_version()
+
+        user = User.objects.create_user(username='tester', password='x')
+        self.pumpkin = Ingredient.objects.create(name='Pumpkin')
+        self.item = Item.objects.create(
+            name='Pumpkin pie', description='Pie', chef=user)
+        self.item.ingredients.add(self.pumpkin)
+        self.old_item = Item.objects.create(
+            name='Ice cream', description='Cold', chef=user)
+
+        today = datetime.date.today()
+        self.menu = Menu.objects.create(season='Fall', expiration_date=today)
+        self.menu.items.add(self.item)
+        self.expired = Menu.objects.create(
+            season='Summer', expiration_date=today - datetime.timedelta(1))
+        self.expired.items.add(self.old_item)
+
+    def test_snapshot_holds_current_menus(self):
+        '''This tests what the snapshot contains.'''
+        snapshot = readmodel.get_snapshot()
+        self.assertEqual([menu.season for menu in snapshot.menus], ['Fall'])
+        self.assertEqual(list(snapshot.items_by_pk), [self.item.pk])
+        item = snapshot.items_by_pk[self.item.pk]
+        self.assertEqual(item.chef, 'tester')
+        self.assertEqual(str(item.ingredients.all()[0]), 'Pumpkin')
+        self.assertIs(snapshot.menus_by_pk[self.menu.pk].items[0], item)
+        self.assertEqual(snapshot.valid_until, self.menu.expiration_date)
+        self.assertGreater(snapshot.size, 0)
+        with self.assertRaises(TypeError):
+            snapshot.items_by_pk[0] = item
+
+    @override_settings(MENU_READ_MODEL_VERSION_TTL=60)
+    def test_views_read_the_snapshot(self):
+        '''This tests that a fresh snapshot serves pages without queries
+        while the version read last is kept.'''
+        readmodel.get_snapshot()
+        with self.assertNumQueries(0):
+            resp = self.client.get(reverse('menu_list'))
+            self.assertContains(resp, 'Pumpkin pie')
+            resp = self.client.get(
+                reverse('menu_detail', kwargs={'pk': self.menu.pk}))
+            self.assertContains(resp, 'Menu expires on')
+            resp = self.client.get(
+                reverse('item_detail', kwargs={'pk': self.item.pk}))
+            self.assertContains(resp, 'Pumpkin')
+
+        # Menus and Items that are not current come from the ORM.
+        resp = self.client.get(
+            reverse('item_detail', kwargs={'pk': self.old_item.pk}))
+        self.assertContains(resp, 'Ice cream')
+        resp = self.client.get(
+            reverse('menu_detail', kwargs={'pk': self.expired.pk}))
+        self.assertContains(resp, 'Summer')
+
+    def test_write_makes_snapshot_stale(self):
+        '''This tests that a change is seen by the next reader.'''
+        snapshot = readmodel.get_snapshot()
+        self.pumpkin.name = 'Squash'
+        self.pumpkin.save()
+        self.assertFalse(
+            readmodel.is_fresh(snapshot, readmodel.current_version()))
+        resp = self.client.get(
+            reverse('item_detail', kwargs={'pk': self.item.pk}))
+        self.assertContains(resp, 'Squash')
+
+    def test_write_from_another_process(self):
+        '''This tests that a change committed by another process, which
+        only bumps the shared version, is seen.'''
+        readmodel.get_snapshot()
+        Menu.objects.filter(pk=self.menu.pk).update(season='Winter')
+        readmodel.bump_version()
+        # Publishing does not use the snapshot.
+        self.assertIn(b'Winter', publish.render_view(views.menu_list, '/'))
+
+        # The views keep the version they read until the TTL runs out.
+        self.assertContains(self.client.get(reverse('menu_list')), 'Fall')
+        readmodel.forget_version()
+        self.assertContains(self.client.get(reverse('menu_list')), 'Winter')
+
+    def test_version_read_through_router(self):
+        '''This tests that readers may take the version from a replica,
+        and that a replica behind the snapshot does not make it stale.'''
+        snapshot = readmodel.get_snapshot()
+        readmodel.forget_version()
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read',
+                               return_value='default') as db_for_read:
+            self.assertIs(readmodel.get_snapshot(), snapshot)
+        db_for_read.assert_called_once_with(ReadModelVersion)
+        self.assertTrue(readmodel.is_fresh(snapshot, snapshot.version - 1))
+
+    def test_nested_disabled(self):
+        '''This tests that leaving an inner disabled() block keeps the
+        outer one in force.'''
+        readmodel.get_snapshot()
+        with readmodel.disabled():
+            with readmodel.disabled():
+                pass
+            self.assertIsNone(readmodel.get_snapshot())
+        self.assertIsNotNone(readmodel.get_snapshot())
+
+    def test_build_reads_default_database(self):
+        '''This tests that a request routed to a replica still builds the
+        snapshot from the default database.'''
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read',
+                               return_value='lagging_replica'):
+            snapshot = readmodel.build()
+        self.assertEqual([menu.season for menu in snapshot.menus], ['Fall'])
+
+    def test_read_model_setting(self):
+        '''This tests that the ORM is used when the setting is off.'''
+        with override_settings(MENU_READ_MODEL=False):
+            self.assertIsNone(readmodel.get_snapshot())
+
+
+# These are the tables a query plan may not walk from start to end.
+QUERY_PLAN_TABLES = {
+    'menu_menu', 'menu_item', 'menu_menu_items', 'menu_item_ingredients'}
+
+# Tables small enough by design that a full scan is fine.
+QUERY_PLAN_SMALL_TABLES = set()
+
+# How many full scans of a table a view may do because showing the whole
+# table is its job: the item lists, the chef summary and the item <select>
+# of the menu form.
+# item_list_stream reads its first chunk by walking the created_date index.
+QUERY_PLAN_ALLOWED_SCANS = {
+    'chef_list': {'menu_item': 1},
+    'item_list': {'menu_item': 1},
+    'item_list_stream': {'menu_item': 1},
+    'menu_new': {'menu_item': 1},
+    'menu_bulk_new': {'menu_item': 1},
+    'menu_edit': {'menu_item': 1},
+}
+
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+@contextmanager
+def capture_statements():
+    '''This records the SQL and parameters of every statement run.'''
+    statements = []
+    execute = CursorWrapper.execute
+
+    def recording_execute(cursor, sql, params=None):
+        statements.append((sql, params))
+        return execute(cursor, sql, params)
+
+    with mock.patch.object(CursorWrapper, 'execute', recording_execute):
+        yield statements
+
+
+def full_scans(statements):
+    '''This runs EXPLAIN QUERY PLAN on each captured statement and
+    returns (table, plan step, sql) for each full scan of a checked table.'''
+    scans = []
+    with connection.cursor() as cursor:
+        for sql, params in statements:
+            if not sql.lstrip().upper().startswith(
+                    ('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params or ())
+            for row in cursor.fetchall():
+                match = SCAN.match(row[-1])
+                if match and match.group(1) in QUERY_PLAN_TABLES and \
+                        match.group(1) not in QUERY_PLAN_SMALL_TABLES:
+                    scans.append((match.group(1), row[-1], sql))
+    return scans
+
+
+@override_settings(MENU_STREAM_CHUNK_SIZE=50)
+class QueryPlanTests(TestCase):
+    '''This checks that every query the menu views run on a seeded
+    catalogue searches an index instead of scanning a whole table.'''
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(items=200, menus=20, ingredients=50)
+        cls.menu = Menu.objects.filter(
+            expiration_date__gte=datetime.date.today()).first()
+        cls.item = cls.menu.items.first()
+
+    def setUp(self):
+        '''This starts every test with full rate limit buckets.'''
+        throttle.reset()
+
+    def assertIndexesUsed(self, view_name, method='get', data=None,
+                          **kwargs):
+        '''This requests a view and fails on any full table scan it is
+        not allowed to do.'''
+        url = reverse(view_name, kwargs=kwargs)
+        with capture_statements() as statements:
+            resp = getattr(self.client, method)(url, data or {})
+            if resp.streaming:
+                b''.join(resp.streaming_content)
+        self.assertLess(resp.status_code, 400)
+        self.assertTrue(statements)
+
+        allowed = dict(QUERY_PLAN_ALLOWED_SCANS.get(view_name, {}))
+        unexpected = []
+        for table, step, sql in full_scans(statements):
+            if allowed.get(table):
+                allowed[table] -= 1
+            else:
+                unexpected.append('{}\n    {}'.format(step, sql))
+        if unexpected:
+            self.fail('{} {} scans:\n{}'.format(
+                method.upper(), url, '\n'.join(unexpected)))
+
+    def menu_form_data(self):
+        return {
+            'season': 'Spring',
+            'items': [self.item.pk],
+            'expiration_date_year': datetime.date.today().year + 1,
+            'expiration_date_month': 1,
+            'expiration_date_day': 1,
+        }
+
+    def test_read_views(self):
+        '''This tests the public read views.'''
+        self.assertIndexesUsed('menu_list')
+        self.assertIndexesUsed('menu_detail', pk=self.menu.pk)
+        self.assertIndexesUsed('item_detail', pk=self.item.pk)
+        self.assertIndexesUsed('item_list')
+        self.assertIndexesUsed('item_list_stream')
+        self.assertIndexesUsed('chef_list')
+        self.assertIndexesUsed('chef_dashboard', pk=self.item.chef_id)
+
+    def test_form_views(self):
+        '''This tests showing the menu forms.'''
+        self.assertIndexesUsed('menu_new')
+        self.assertIndexesUsed('menu_bulk_new')
+        self.assertIndexesUsed('menu_edit', pk=self.menu.pk)
+        self.assertIndexesUsed('menu_delete', pk=self.menu.pk)
+
+    def test_write_views(self):
+        '''This tests creating, changing and deleting a menu.'''
+        self.assertIndexesUsed('menu_new', 'post', self.menu_form_data())
+        self.assertIndexesUsed('menu_bulk_new', 'post', bulk_menu_data(
+            [('Spring', [self.item.pk]), ('Summer', [self.item.pk])]))
+        self.assertIndexesUsed('menu_edit', 'post', self.menu_form_data(),
+                               pk=self.menu.pk)
+        self.assertIndexesUsed('menu_delete', 'post', pk=self.menu.pk)
@@ -0,0 +1,177 @@
+'''This sheds write traffic before it costs any database work.
+
+Requests to the views in MENU_RATE_LIMIT['VIEWS'] take a token from a
+bucket for the client IP and one for the session cookie, and get a 429
+when either is empty. Write views are also capped at
+MENU_WRITE_CONCURRENCY requests at a time and answer 503 past that.
+Everything is in process memory, so each worker counts on its own.
+Every turned away request is logged as a warning with the number this
+worker has turned away so far, and the worker logs all of its counts
+when it exits.
+'''
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+shed_counts = Counter()
+_shed_lock = threading.Lock()
+
+
+def count_shed(reason, view_name):
+    '''This records a request that was turned away.'''
+    with _shed_lock:
+        shed_counts[reason, view_name] += 1
+        count = shed_counts[reason, view_name]
+    logger.warning('Shed %s request to %s (%s so far in worker %s)',
+                   reason, view_name, count, os.getpid())
+
+
+def stats():
+    '''This returns a copy of the shed request counters.'''
+    with _shed_lock:
+        return dict(shed_counts)
+
+
+@atexit.register
+def log_stats():
+    '''This logs how many requests this worker turned away.'''
+    counts = stats()
+    if counts:
+        logger.warning('Worker %s shed %s', os.getpid(), ', '.join(
+            '{} {} requests to {}'.format(count, reason, view_name)
+            for (reason, view_name), count in sorted(counts.items())))
+
+
+class TokenBucket(object):
+    '''This holds a bucket of tokens per key that refills at rate tokens
+    per second up to burst tokens.'''
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, keys, now=None):
+        '''This takes a token for every key if all of them have one, and
+        otherwise returns how many seconds until they will.'''
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            levels = {}
+            for key in keys:
+                tokens, updated = self.buckets.get(key, (self.burst, now))
+                levels[key] = min(
+                    self.burst, tokens + (now - updated) * self.rate)
+
+            wait = max([(1 - tokens) / self.rate
+                        for tokens in levels.values() if tokens < 1] or [0])
+            if not wait:
+                for key, tokens in levels.items():
+                    self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > self.max_keys:
+                self.prune(now)
+            return wait
+
+    def prune(self, now):
+        '''This forgets the buckets that have filled up again.'''
+        refill = self.burst / self.rate
+        for key, (_, updated) in list(self.buckets.items()):
+            if now - updated >= refill:
+                del self.buckets[key]
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket():
+    '''This returns the TokenBucket for the current MENU_RATE_LIMIT.'''
+    config = settings.MENU_RATE_LIMIT
+    key = (config['RATE'], config['BURST'])
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(config['RATE'], config['BURST'])
+        return _buckets[key]
+
+
+def client_keys(request):
+    '''This returns the bucket keys for the client IP and session.'''
+    keys = ['ip:' + request.META.get('REMOTE_ADDR', '')]
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        keys.append('session:' + session_key)
+    return keys
+
+
+def too_many_requests(wait):
+    '''This tells the client how long to wait before trying again.'''
+    response = HttpResponse('Too many requests, slow down.', status=429,
+                            content_type='text/plain')
+    response['Retry-After'] = str(int(wait) + 1)
+    return response
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_semaphore(view_name, limit):
+    '''This returns the semaphore guarding a view.'''
+    with _semaphores_lock:
+        key = (view_name, limit)
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(limit)
+        return _semaphores[key]
+
+
+def concurrency_limit(view):
+    '''This lets at most MENU_WRITE_CONCURRENCY requests into a view at
+    once and answers a 503 straight away to any more.'''
+    @wraps(view)
+    def limited_view(request, *args, **kwargs):
+        limit = settings.MENU_WRITE_CONCURRENCY
+        if not limit:
+            return view(request, *args, **kwargs)
+
+        semaphore = get_semaphore(view.__name__, limit)
+        if not semaphore.acquire(blocking=False):
+            count_shed('concurrency', view.__name__)
+            response = HttpResponse('The server is busy, try again.',
+                                    status=503, content_type='text/plain')
+            response['Retry-After'] = '1'
+            return response
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            semaphore.release()
+    return limited_view
+
+
+def reset():
+    '''This forgets every bucket, semaphore and shed count, as if the
+    process had just started. Tests call it so earlier requests from the
+    same test client do not use up the limit.'''
+    with _buckets_lock:
+        _buckets.clear()
+    with _semaphores_lock:
+        _semaphores.clear()
+    with _shed_lock:
+        shed_counts.clear()
+
+
+@receiver(setting_changed)
+def limits_changed(setting, **kwargs):
+    if setting in ('MENU_RATE_LIMIT', 'MENU_WRITE_CONCURRENCY'):
+        reset()
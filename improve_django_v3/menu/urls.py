@@ -3,10 +3,14 @@ from . import views
 
 urlpatterns = [
     url(r'^$', views.menu_list, name='menu_list'),
+    url(r'^item/stream/$', views.item_list_stream, name='item_list_stream'),
     url(r'^item/', views.item_list, name='item_list'),
     url(r'^menu/(?P<pk>\d+)/edit/$', views.edit_menu, name='menu_edit'),
     url(r'^menu/(?P<pk>\d+)/$', views.menu_detail, name='menu_detail'),
     url(r'^menu/delete/(?P<pk>\d+)/$', views.delete_menu, name='menu_delete'),
     url(r'^menu/item/(?P<pk>\d+)/$', views.item_detail, name='item_detail'),
     url(r'^menu/new/$', views.create_new_menu, name='menu_new'),
+    url(r'^menu/new/bulk/$', views.bulk_create_menus, name='menu_bulk_new'),
+    url(r'^chef/$', views.chef_list, name='chef_list'),
+    url(r'^chef/(?P<pk>\d+)/$', views.chef_dashboard, name='chef_dashboard'),
 ]
@@ -1,12 +1,20 @@
 import datetime
 from operator import attrgetter
 
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404
+from django.db import transaction
+from django.db.models import Case, Count, Q, When
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
 
+from . import purge, readmodel
 from .models import Item, Menu
-from .forms import MenuForm
+from .forms import MenuForm, MenuFormSet
+from .throttle import concurrency_limit
 
 
 def item_list(request):
@@ -16,34 +24,79 @@ def item_list(request):
     return render(request, 'menu/item_list.html', {'items': items})
 
 
+def stream_items(chunk_size):
+    '''This yields lists of Items ordered by created_date, reading one
+    chunk at a time so only chunk_size Items are in memory at once.'''
+    items = Item.objects.order_by('created_date', 'pk')
+    chunk = list(items[:chunk_size])
+    while chunk:
+        yield chunk
+        last = chunk[-1]
+        # This is written without an OR so the created_date index is
+        # searched instead of walked from the start for every chunk.
+        chunk = list(items.filter(
+            Q(created_date__gte=last.created_date) &
+            ~Q(created_date=last.created_date, pk__lte=last.pk)
+        )[:chunk_size])
+
+
+def item_list_stream(request):
+    '''This streams every Item to the user. The page layout is sent
+    straight away and the Items follow as they are read.'''
+    items_marker = '<!-- items -->'
+    page = render_to_string('menu/item_list_stream.html',
+                            {'items_marker': mark_safe(items_marker)},
+                            request=request)
+    head, foot = page.split(items_marker)
+    items_template = get_template('menu/item_list_items.html')
+
+    def content():
+        yield head
+        for chunk in stream_items(settings.MENU_STREAM_CHUNK_SIZE):
+            yield items_template.render({'items': chunk})
+        yield foot
+
+    return StreamingHttpResponse(content())
+
+
 def item_detail(request, pk):
     '''This shows the user information about an Item.'''
-    try:
-        item = Item.objects.get(pk=pk)
-    except ObjectDoesNotExist:
-        raise Http404
+    snapshot = readmodel.get_snapshot()
+    if snapshot is not None and int(pk) in snapshot.items_by_pk:
+        item = snapshot.items_by_pk[int(pk)]
+    else:
+        try:
+            item = Item.objects.get(pk=pk)
+        except ObjectDoesNotExist:
+            raise Http404
     return render(request, 'menu/item_detail.html', {'item': item})
 
 
 def menu_list(request):
     '''This returns a list of all the Menus.'''
-    all_menus = Menu.objects.all().prefetch_related('items')
-    menus = []
-    for menu in all_menus:
-        if menu.expiration_date >= datetime.date.today():
-            menus.append(menu)
-
-    menus = sorted(menus, key=attrgetter('expiration_date'))
+    snapshot = readmodel.get_snapshot()
+    if snapshot is not None:
+        menus = snapshot.menus
+    else:
+        menus = Menu.objects.filter(
+            expiration_date__gte=datetime.date.today()
+        ).order_by('expiration_date').prefetch_related('items')
     return render(request,
                   'menu/list_all_current_menus.html', {'menus': menus})
 
 
 def menu_detail(request, pk):
     '''This shows the user information about a Menu.'''
-    menu = Menu.objects.get(pk=pk)
+    snapshot = readmodel.get_snapshot()
+    if snapshot is not None and int(pk) in snapshot.menus_by_pk:
+        menu = snapshot.menus_by_pk[int(pk)]
+    else:
+        menu = Menu.objects.get(pk=pk)
     return render(request, 'menu/menu_detail.html', {'menu': menu})
 
 
+@concurrency_limit
+@transaction.atomic
 def create_new_menu(request):
     '''This creates a new Menu object.'''
     if request.method == "POST":
@@ -62,6 +115,18 @@ def create_new_menu(request):
     return render(request, 'menu/menu_edit.html', {'form': form})
 
 
+@concurrency_limit
+def bulk_create_menus(request):
+    '''This creates many Menu objects from one form.'''
+    formset = MenuFormSet(request.POST or None)
+    if request.method == 'POST' and formset.is_valid():
+        formset.save()
+        return redirect('menu_list')
+    return render(request, 'menu/menu_bulk_new.html', {'formset': formset})
+
+
+@concurrency_limit
+@transaction.atomic
 def edit_menu(request, pk):
     '''This allows a user to edit a Menu object.'''
     instance = get_object_or_404(Menu, pk=pk)
@@ -78,12 +143,56 @@ def edit_menu(request, pk):
         request, 'menu/menu_edit.html', {'form': form, 'pk': int(instance.pk)})
 
 
+@concurrency_limit
+@transaction.atomic
 def delete_menu(request, pk):
     '''This allows a user to delete a Menu object.'''
     menu = get_object_or_404(Menu, pk=pk)
     if request.method == 'POST':
-        menu.delete()
+        purge.purge(Menu.objects.filter(pk=menu.pk))
         return redirect('menu_list')
     return render(
         request, 'menu/menu_delete.html', {'menu': menu}
     )
+
+
+def chef_item_counts(today):
+    '''This returns the aggregates shown for a chef's Items: how many
+    current Menus and how many Ingredients they count.'''
+    return {
+        'current_menu_count': Count(
+            Case(When(items__expiration_date__gte=today, then='items')),
+            distinct=True),
+        'ingredient_count': Count('ingredients', distinct=True),
+    }
+
+
+def chef_list(request):
+    '''This sums up the workload of every chef in one grouped query.'''
+    chefs = Item.objects.values('chef_id', 'chef__username').annotate(
+        item_count=Count('pk', distinct=True),
+        **chef_item_counts(datetime.date.today())
+    ).order_by('chef__username')
+    return render(request, 'menu/chef_list.html', {'chefs': chefs})
+
+
+def chef_dashboard(request, pk):
+    '''This shows a chef their Items, how many current Menus each is on
+    and their Ingredients, a page at a time.'''
+    chef = get_object_or_404(User, pk=pk)
+    items = Item.objects.filter(chef_id=chef.pk).annotate(
+        **chef_item_counts(datetime.date.today())
+    ).prefetch_related('ingredients').order_by('pk')
+
+    after = request.GET.get('after', '')
+    if after.isdigit():
+        items = items.filter(pk__gt=int(after))
+    page_size = settings.MENU_CHEF_PAGE_SIZE
+    items = list(items[:page_size + 1])
+    next_after = items[page_size - 1].pk if len(items) > page_size else None
+
+    return render(request, 'menu/chef_dashboard.html', {
+        'chef': chef,
+        'items': items[:page_size],
+        'next_after': next_after,
+    })
@@ -0,0 +1,112 @@
+'''This sends the public read views to the read replicas.
+
+ReplicaMiddleware marks GET and HEAD requests to the views in
+REPLICA_READ_VIEWS and to the admin changelists as safe to read from a
+replica, and ReplicaRouter then picks one of DATABASE_REPLICAS for their
+reads, by weight in turn. Everything else reads and writes the default
+database. After a session writes something its reads stay on the
+default database for REPLICA_PIN_SECONDS, so it sees its own changes.
+'''
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+
+PRIMARY = 'default'
+PIN_SESSION_KEY = 'replica_pinned_until'
+
+_state = threading.local()
+_cycles = {}
+_cycles_lock = threading.Lock()
+
+
+def reading_from_replica():
+    '''This tells if the current request may read from a replica.'''
+    return getattr(_state, 'use_replica', False)
+
+
+def choose_replica():
+    '''This returns the next replica alias, cycling through them in
+    proportion to their weights.'''
+    replicas = tuple(sorted(settings.DATABASE_REPLICAS.items()))
+    with _cycles_lock:
+        if replicas not in _cycles:
+            _cycles[replicas] = itertools.cycle([
+                alias for alias, weight in replicas for _ in range(weight)])
+        return next(_cycles[replicas])
+
+
+class ReplicaRouter(object):
+    '''This reads from a replica when the request allows it and always
+    writes to the default database.'''
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and reading_from_replica():
+            alias = choose_replica()
+            # A replica that is the default database, like a test mirror,
+            # is read through the default connection so it sees the same
+            # transaction.
+            if alias in connections and \
+                    connections[alias].settings_dict['NAME'] != \
+                    connections[PRIMARY].settings_dict['NAME']:
+                return alias
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the default database.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return True
+
+
+def is_read_view(request):
+    '''This tells if a request only reads data a replica can serve.'''
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    url_name = request.resolver_match.url_name or ''
+    return (url_name in settings.REPLICA_READ_VIEWS or
+            url_name.endswith('_changelist'))
+
+
+class ReplicaMiddleware(object):
+    '''This decides for each request whether its reads may go to a
+    replica and keeps a session on the default database right after it
+    writes. It has to come after SessionMiddleware.'''
+
+    def process_request(self, request):
+        _state.use_replica = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or not is_read_view(request):
+            return None
+        # Reading the session adds Vary: Cookie, which would keep shared
+        # caches from storing the public pages, so only clients that have
+        # a session, and so could have written, get theirs read.
+        pinned_until = 0
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            pinned_until = request.session.get(PIN_SESSION_KEY, 0)
+        _state.use_replica = pinned_until < time.time()
+        return None
+
+    def process_response(self, request, response):
+        # The replica flag stays set until request_finished so streamed
+        # responses keep reading from the same place.
+        if settings.DATABASE_REPLICAS and hasattr(request, 'session') and \
+                request.method not in ('GET', 'HEAD', 'OPTIONS') and \
+                response.status_code < 400:
+            request.session[PIN_SESSION_KEY] = (
+                time.time() + settings.REPLICA_PIN_SECONDS)
+        return response
+
+
+@receiver(request_finished)
+def reset_replica_flag(**kwargs):
+    _state.use_replica = False
@@ -16,6 +16,10 @@ import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+# The profile picks between development-only tools and production
+# settings. Set DJANGO_PROFILE to anything but 'dev' when deploying.
+PROFILE = os.environ.get('DJANGO_PROFILE', 'dev')
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.8/howto/deployment/checklist/
 
@@ -23,9 +27,12 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '-gs+&x$kl3g_*zop(9hi6p-u5nscicrymm6k%^!zu3(3ii4&iz'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = PROFILE == 'dev'
 
-ALLOWED_HOSTS = []
+# Outside of DEBUG only these hosts are served; set DJANGO_ALLOWED_HOSTS
+# to a comma separated list when deploying.
+ALLOWED_HOSTS = os.environ.get(
+    'DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 
 
 # Application definition
@@ -37,13 +44,14 @@ INSTALLED_APPS = (
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'menu',
 )
 
 MIDDLEWARE_CLASSES = (
+    'menu.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'menu.middleware.RateLimitMiddleware',
+    'mysite.routers.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -51,8 +59,19 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'menu.middleware.HTMLMinifyMiddleware',
 )
 
+# The debug toolbar is only installed, and so only imported, in the dev
+# profile.
+if PROFILE == 'dev':
+    INSTALLED_APPS += ('debug_toolbar',)
+    MIDDLEWARE_CLASSES = (
+        MIDDLEWARE_CLASSES[:2] +
+        ('debug_toolbar.middleware.DebugToolbarMiddleware',) +
+        MIDDLEWARE_CLASSES[2:]
+    )
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -71,8 +90,26 @@ TEMPLATES = [
     },
 ]
 
+# Outside of dev, parsed templates are kept in memory between requests.
+if PROFILE != 'dev':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Set DJANGO_WARMUP=1 to have mysite.wsgi import, compile, reverse, parse
+# and connect everything before the worker takes its first request.
+# `manage.py startup_profile` shows what each step costs.
+
+WARMUP_PACKAGES = ('menu', 'mysite')
+
+WARMUP_TEMPLATE_PREFIXES = ('menu/',)
+
 
 # Database
 # https://docs.djangoproject.com/en/1.8/ref/settings/#databases
@@ -84,6 +121,36 @@ DATABASES = {
     }
 }
 
+# Read replicas and their weights. The public read views and the admin
+# changelists read from them, and everything else uses 'default'. To try it
+# locally copy db.sqlite3 to replica.sqlite3 and set
+# DJANGO_REPLICA_DB=replica.sqlite3.
+
+DATABASE_REPLICAS = {}
+
+if os.environ.get('DJANGO_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, os.environ['DJANGO_REPLICA_DB']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS['replica'] = 1
+
+DATABASE_ROUTERS = ['mysite.routers.ReplicaRouter']
+
+REPLICA_READ_VIEWS = (
+    'menu_list',
+    'menu_detail',
+    'item_list',
+    'item_list_stream',
+    'item_detail',
+    'chef_list',
+    'chef_dashboard',
+)
+
+# How long a session keeps reading from 'default' after it writes.
+REPLICA_PIN_SECONDS = 5
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -104,9 +171,134 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-# The following STATIC_ROOT was disabled to get custom CSS working.
-# STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# Fingerprinted and gzipped files need `manage.py collectstatic` to have
+# been run, so they are only used outside of DEBUG.
+if not DEBUG:
+    STATICFILES_STORAGE = 'menu.assets.GzipManifestStaticFilesStorage'
+
+# Let Django serve STATIC_ROOT with far-future caching when no web server
+# sits in front of it.
+MENU_SERVE_STATIC = not DEBUG
+
+# Third party assets vendored in menu/static. `manage.py vendor_assets`
+# fetches these pinned versions again; one that is missing is linked from
+# the CDN instead.
+BOOTSTRAP_CDN = '//maxcdn.bootstrapcdn.com/bootstrap/3.2.0/'
+
+MENU_VENDOR_ASSETS = {
+    'menu/vendor/bootstrap/css/bootstrap.min.css':
+        BOOTSTRAP_CDN + 'css/bootstrap.min.css',
+    'menu/vendor/bootstrap/css/bootstrap-theme.min.css':
+        BOOTSTRAP_CDN + 'css/bootstrap-theme.min.css',
+}
+for extension in ('eot', 'svg', 'ttf', 'woff'):
+    MENU_VENDOR_ASSETS[
+        'menu/vendor/bootstrap/fonts/glyphicons-halflings-regular.' +
+        extension] = (BOOTSTRAP_CDN + 'fonts/glyphicons-halflings-regular.' +
+                      extension)
+
+# The stylesheets `manage.py build_assets` minifies into one bundle.
+MENU_CSS_BUNDLE = (
+    'menu/vendor/bootstrap/css/bootstrap.min.css',
+    'menu/vendor/bootstrap/css/bootstrap-theme.min.css',
+    'menu/css/global.css',
+)
+
+MENU_CSS_BUNDLE_NAME = 'menu/css/bundle.min.css'
 
 # This setting is to get the django toolbar working.
 
 INTERNAL_IPS = ('127.0.0.1',)
+
+
+# Pre-rendered static copies of the public menu pages.
+# Run `manage.py publish_menus --watch` to build them and rebuild at every
+# expiration_date rollover. With MENU_PUBLISH_ON_SAVE a job to rewrite the
+# pages affected by a Menu/Item change is queued when the change commits.
+
+MENU_PUBLISH_ROOT = os.path.join(BASE_DIR, 'published')
+
+MENU_PUBLISH_ON_SAVE = False
+
+
+# Responses smaller than MENU_GZIP_MIN_LENGTH bytes (and never below 200)
+# or of a type not listed here are sent uncompressed. So is any page that
+# rendered {% csrf_token %}, like the menu forms, because gzipping a
+# secret next to reflected input exposes it to the BREACH attack.
+
+MENU_GZIP_MIN_LENGTH = 500
+
+MENU_GZIP_CONTENT_TYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+)
+
+# Collapse the template indentation out of HTML responses.
+# `manage.py benchmark_compression` shows what it and gzip save.
+
+MENU_MINIFY_HTML = True
+
+
+# Each client IP and session may send BURST requests to these views at
+# once and then RATE per second. Write views also turn away requests
+# beyond MENU_WRITE_CONCURRENCY at a time (0 turns that off). Each
+# turned away request is logged as a warning by menu.throttle with the
+# worker's running total, and each worker logs its totals when it exits.
+
+MENU_RATE_LIMIT = {
+    'RATE': 0.5,
+    'BURST': 10,
+    'METHODS': ('POST',),
+    'VIEWS': ('menu_new', 'menu_bulk_new', 'menu_edit', 'menu_delete'),
+}
+
+MENU_WRITE_CONCURRENCY = 4
+
+
+# How many Items item_list_stream reads and renders at a time.
+
+MENU_STREAM_CHUNK_SIZE = 200
+
+
+# Background jobs queued with menu.jobs.enqueue() and run by
+# `manage.py run_worker`. A failed job is retried after JOB_RETRY_DELAY
+# seconds, doubling each time, until it has been tried JOB_MAX_ATTEMPTS
+# times. A job still running after JOB_TIMEOUT seconds counts as failed,
+# so it has to be longer than the slowest job takes.
+
+JOB_MAX_ATTEMPTS = 5
+
+JOB_RETRY_DELAY = 10
+
+JOB_TIMEOUT = 600
+
+
+# How many Items the chef dashboard shows per page.
+
+MENU_CHEF_PAGE_SIZE = 25
+
+
+# Serve menu_list, menu_detail and item_detail from an in-memory snapshot
+# of the current menus (see menu.readmodel). False always uses the ORM.
+# `manage.py readmodel_stats` shows its size and build time.
+
+MENU_READ_MODEL = True
+
+# How many seconds each process keeps the read model version before
+# reading it again. A change made by another process reaches this one's
+# snapshot that much later.
+
+MENU_READ_MODEL_VERSION_TTL = 1
+
+
+# How many rows menu.purge deletes per transaction, for `manage.py purge`,
+# the admin bulk delete action and the menu delete view. SQLite allows at
+# most 999 parameters in one statement.
+
+MENU_PURGE_BATCH_SIZE = 500
@@ -17,16 +17,23 @@ from django.conf import settings
 from django.conf.urls import include, url
 from django.contrib import admin
 
+from menu import assets
+
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
     url(r'', include('menu.urls')),
 ]
 
+if settings.MENU_SERVE_STATIC:
+    urlpatterns.insert(0, url(
+        r'^{}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')),
+        assets.serve))
+
 
 # This is to get the django-debug-toolbar working during development.
-# This may need to be disabled on other user's machines.
+# It is only installed in the dev profile.
 
-if settings.DEBUG:
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns += [
         url(r'^__debug__/', include(debug_toolbar.urls)),
@@ -0,0 +1,137 @@
+'''This pays the start up costs of a worker before it takes traffic.
+
+Without it the first requests after a deploy or worker recycle import
+the views, compile the URL regexes, parse the templates and open the
+database connection themselves. Call warmup() in the worker process
+itself, after any fork, so the connection it opens is its own.
+'''
+import importlib
+import os
+import pkgutil
+import time
+
+import django
+from django.conf import settings
+from django.core.urlresolvers import NoReverseMatch, get_resolver, reverse
+from django.db import connections
+from django.template import engines
+from django.template.loader import get_template
+from django.template.utils import get_app_template_dirs
+
+# These are not needed to serve requests.
+SKIPPED_MODULES = ('migrations', 'management', 'tests', 'wsgi')
+
+
+def project_modules():
+    '''This lists every module of the project's own packages.'''
+    names = []
+    for package_name in settings.WARMUP_PACKAGES:
+        package = importlib.import_module(package_name)
+        names.append(package_name)
+        for _, name, _ in pkgutil.walk_packages(
+                package.__path__, package_name + '.'):
+            if not set(name.split('.')) & set(SKIPPED_MODULES):
+                names.append(name)
+    return names
+
+
+def import_modules():
+    '''This imports the project modules, which includes all the views.'''
+    for name in project_modules():
+        importlib.import_module(name)
+
+
+def compile_urls(resolver=None):
+    '''This compiles the regex of every URL pattern and the lookup tables
+    reverse() uses.'''
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        pattern.regex
+        if hasattr(pattern, 'url_patterns'):
+            compile_urls(pattern)
+
+
+def reverse_routes(resolver=None, prefix=''):
+    '''This reverses every named route once, namespaced ones included,
+    filling in 1 for any argument it needs. It returns how many worked.'''
+    resolver = resolver or get_resolver()
+    reversed_count = 0
+    for name, possibilities in list(resolver.reverse_dict.lists()):
+        if not isinstance(name, str):
+            continue
+        for possibility, _, _ in possibilities:
+            for _, params in possibility:
+                try:
+                    reverse(prefix + name,
+                            kwargs={param: '1' for param in params})
+                except NoReverseMatch:
+                    continue
+                reversed_count += 1
+    for namespace, (_, sub_resolver) in resolver.namespace_dict.items():
+        reversed_count += reverse_routes(
+            sub_resolver, prefix + namespace + ':')
+    return reversed_count
+
+
+def template_names():
+    '''This lists the templates under settings.WARMUP_TEMPLATE_PREFIXES.'''
+    names = set()
+    directories = list(get_app_template_dirs('templates'))
+    for engine in engines.all():
+        directories.extend(engine.dirs)
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(root, file_name),
+                                       directory).replace(os.sep, '/')
+                if name.startswith(settings.WARMUP_TEMPLATE_PREFIXES):
+                    names.add(name)
+    return sorted(names)
+
+
+def load_templates():
+    '''This parses the project's templates into the cached loader.'''
+    for name in template_names():
+        get_template(name)
+
+
+def connect_databases():
+    '''This opens a connection to every configured database.'''
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+STEPS = (
+    ('import modules', import_modules),
+    ('compile urls', compile_urls),
+    ('reverse routes', reverse_routes),
+    ('load templates', load_templates),
+    ('connect databases', connect_databases),
+)
+
+
+def warmup():
+    '''This runs every warmup step and returns how long each one took.'''
+    timings = []
+    for name, step in STEPS:
+        start = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - start))
+    return timings
+
+
+def profile_startup():
+    '''This times django.setup(), the import of each project module and
+    every warmup step of a fresh interpreter.'''
+    start = time.perf_counter()
+    django.setup()
+    timings = [('django.setup()', time.perf_counter() - start)]
+
+    for name in project_modules():
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings.append(('import ' + name, time.perf_counter() - start))
+    for name, seconds in warmup():
+        timings.append(('warmup: ' + name, seconds))
+    return timings